@@ -0,0 +1,240 @@
+import argparse
+import copy
+import json
+import math
+import multiprocessing
+import platform
+import resource
+import statistics
+import sys
+import time
+import torch
+from functools import partial
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+BRUTE_FORCE_LIMIT = 20000
+LATTICE_SPACING = 4.0
+
+def scaled_config(config, n_particles, box_scale):
+    # Shared with benchmarks/scaling.py; kept here so single-process benchmarks never import torch.distributed
+    config = copy.deepcopy(config)
+    counts = config['particles']['count']
+    total = sum(counts.values())
+    config['particles']['count'] = {symbol: max(1, round(n_particles * count / total)) for symbol, count in counts.items()}
+    config['boundary']['size'] = [size * box_scale for size in config['boundary']['size']]
+    config['particles']['initial_state'] = "lattice"
+    config['physics']['thermostat'] = "none"
+    return config
+
+def _particles(config, n, device):
+    # The box grows with N at a fixed liquid-like density so every size sees the same neighbor structure
+    from src.utils import create_particles
+    box_side = LATTICE_SPACING * math.ceil(n ** (1.0 / 3.0))
+    config = scaled_config(config, n, box_side / max(config['boundary']['size']))
+    torch.manual_seed(0)
+    return create_particles(config, device), config
+
+def _force_kwargs(config):
+    from src.physics import find_k_nearest_cells
+    return {'neighbor_fn': partial(find_k_nearest_cells, box_size=config['boundary']['size'])}
+
+def setup_neighbors_cell(config, n, device):
+    from src.physics import find_k_nearest_cells
+    particles, config = _particles(config, n, device)
+    k = min(config['physics']['k_neighbors'], particles.n_particles - 1)
+    return lambda: find_k_nearest_cells(particles.positions, k, config['boundary']['size'])
+
+def setup_neighbors_brute(config, n, device):
+    from src.physics import find_k_nearest
+    if n > BRUTE_FORCE_LIMIT:
+        return None
+    particles, config = _particles(config, n, device)
+    k = min(config['physics']['k_neighbors'], particles.n_particles - 1)
+    return lambda: find_k_nearest(particles.positions, k)
+
+def setup_forces(config, n, device):
+    from src.physics import compute_forces
+    particles, config = _particles(config, n, device)
+    physics = config['physics']
+    return lambda: compute_forces(particles, physics['k_neighbors'], physics['coulomb_constant'], **_force_kwargs(config))
+
+def _setup_step(integrator, config, n, device):
+    from src.integrator import INTEGRATORS
+    particles, config = _particles(config, n, device)
+    physics = config['physics']
+    step = INTEGRATORS[integrator]
+    force_kwargs = _force_kwargs(config)
+    dt = config['simulation']['dt']
+    return lambda: step(particles, dt, physics['k_neighbors'], physics['coulomb_constant'], **force_kwargs)
+
+def setup_boundary(config, n, device):
+    from src.physics import apply_boundary
+    particles, config = _particles(config, n, device)
+    boundary = config['boundary']
+    return lambda: apply_boundary(particles, boundary['size'], boundary['restitution'])
+
+def setup_thermostat(config, n, device):
+    particles, config = _particles(config, n, device)
+    physics = config['physics']
+    dt = config['simulation']['dt']
+    return lambda: particles.apply_thermostat(physics['temperature'], physics['thermostat_tau'], dt)
+
+def setup_create_particles(config, n, device):
+    return lambda: _particles(config, n, device)
+
+CASES = {
+    'neighbors_cell': setup_neighbors_cell,
+    'neighbors_brute': setup_neighbors_brute,
+    'forces': setup_forces,
+    'euler_step': partial(_setup_step, 'euler'),
+    'verlet_step': partial(_setup_step, 'velocity_verlet'),
+    'boundary': setup_boundary,
+    'thermostat': setup_thermostat,
+    'create_particles': setup_create_particles,
+}
+
+def _synchronize(device):
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    elif device == 'mps':
+        torch.mps.synchronize()
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def measure(case, n, config, device='cpu', min_time=0.2, max_repeats=50):
+    baseline_rss = _peak_rss_bytes()
+    if device == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+
+    fn = CASES[case](config, n, device)
+    if fn is None:
+        return {'case': case, 'n': n, 'skipped': True}
+
+    fn()
+    _synchronize(device)
+
+    # Repeat until min_time has elapsed so small sizes are not dominated by timer resolution
+    times = []
+    total = 0.0
+    while len(times) < max_repeats and (total < min_time or len(times) < 3):
+        start = time.perf_counter()
+        fn()
+        _synchronize(device)
+        times.append(time.perf_counter() - start)
+        total += times[-1]
+
+    if device == 'cuda':
+        peak_memory = torch.cuda.max_memory_allocated()
+    else:
+        peak_memory = max(0, _peak_rss_bytes() - baseline_rss)
+
+    median = statistics.median(times)
+    return {
+        'case': case,
+        'n': n,
+        'time': median,
+        'min_time': min(times),
+        'per_sec': 1.0 / max(median, 1e-12),
+        'repeats': len(times),
+        'peak_memory': peak_memory,
+    }
+
+def _measure_task(args):
+    case, n, config, device, min_time = args
+    return measure(case, n, config, device, min_time)
+
+def run_suite(config, cases, sizes, device='cpu', min_time=0.2, isolate=True):
+    # Each (case, N) runs in a fresh process when isolated, so peak memory is not inherited from larger runs
+    tasks = [(case, n, config, device, min_time) for case in cases for n in sizes]
+    if not isolate:
+        return [_measure_task(task) for task in tasks]
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return list(pool.imap(_measure_task, tasks))
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'threads': torch.get_num_threads(),
+    }
+
+def compare(results, baseline, threshold):
+    # A result regresses when its median time exceeds the baseline by more than threshold (fractional)
+    reference = {(r['case'], r['n']): r for r in baseline['results'] if not r.get('skipped')}
+    regressions = []
+    for result in results:
+        previous = reference.get((result['case'], result['n']))
+        if previous is None or result.get('skipped'):
+            continue
+        ratio = result['time'] / previous['time']
+        result['baseline_ratio'] = ratio
+        if ratio > 1.0 + threshold:
+            regressions.append(result)
+    return regressions
+
+def format_table(results):
+    lines = [f"{'case':18s} {'N':>9s} {'time (ms)':>12s} {'per sec':>12s} {'peak MB':>9s} {'vs base':>8s}"]
+    for r in results:
+        if r.get('skipped'):
+            lines.append(f"{r['case']:18s} {r['n']:9d} {'skipped':>12s}")
+            continue
+        ratio = f"{r['baseline_ratio']:.2f}x" if 'baseline_ratio' in r else "-"
+        lines.append(f"{r['case']:18s} {r['n']:9d} {1e3 * r['time']:12.3f} {r['per_sec']:12.1f} "
+                     f"{r['peak_memory'] / 2 ** 20:9.1f} {ratio:>8s}")
+    return "\n".join(lines)
+
+def main():
+    from src.utils import load_config
+
+    parser = argparse.ArgumentParser(description="Hot-path benchmarks with JSON baselines")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--min-time', type=float, default=0.2, help="Seconds of repeats per measurement")
+    parser.add_argument('--baseline', default='benchmarks/baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help="Write these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    parser.add_argument('--no-isolate', action='store_true', help="Run every case in this process")
+    args = parser.parse_args()
+
+    config = load_config()
+    results = run_suite(config, args.cases, sorted(args.sizes), args.device, args.min_time, not args.no_isolate)
+    report = {'environment': environment(), 'device': args.device, 'results': results}
+
+    regressions = []
+    if not args.save_baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        else:
+            if baseline['environment'] != report['environment']:
+                print("Warning: baseline was recorded in a different environment")
+            regressions = compare(results, baseline, args.threshold)
+
+    print(format_table(results))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {100 * args.threshold:.0f}%:")
+        for r in regressions:
+            print(f"  {r['case']} N={r['n']}: {r['baseline_ratio']:.2f}x baseline")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import torch.distributed as dist
+from benchmarks.harness import scaled_config
+from src.domain import DomainDecomposition, DomainSimulator, launch
+from src.utils import load_config
+
+def worker(rank, world_size, config, steps, results_path):
+    domain = DomainDecomposition(config['boundary']['size'], config['distributed']['halo'],
+                                 config['boundary'].get('type', 'box') == 'periodic', config['distributed'].get('grid'))
+    local, ids = domain.populate(config)
+    simulator = DomainSimulator(local, ids, config, domain)
+    simulator.run(1)
+    stats = simulator.run(steps)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    stats['peak_memory_per_rank'] = int(domain.all_reduce(peak, dist.ReduceOp.MAX))
+
+    if rank == 0:
+        with open(results_path, 'w') as f:
+            json.dump(stats, f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Strong/weak scaling of the domain-decomposed engine")
+    parser.add_argument('--ranks', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--mode', choices=['strong', 'weak', 'both'], default='both')
+    parser.add_argument('--particles', type=int, default=4000,
+                        help="Total particles (strong) or particles per rank (weak)")
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--halo', type=float, default=8.0)
+    parser.add_argument('--output', default='scaling.json')
+    args = parser.parse_args()
+
+    base = load_config()
+    base.setdefault('distributed', {})['halo'] = args.halo
+    base['simulation']['integrator'] = 'Verlet'
+    modes = ['strong', 'weak'] if args.mode == 'both' else [args.mode]
+
+    results = []
+    for mode in modes:
+        baseline = None
+        for ranks in args.ranks:
+            if mode == 'strong':
+                config = scaled_config(base, args.particles, 1.0)
+            else:
+                config = scaled_config(base, args.particles * ranks, ranks ** (1.0 / 3.0))
+
+            results_path = f"{args.output}.rank0.tmp"
+            launch(worker, ranks, config, args.steps, results_path)
+            with open(results_path) as f:
+                stats = json.load(f)
+            os.remove(results_path)
+
+            baseline = baseline or stats
+            ideal = ranks / baseline['ranks'] if mode == 'strong' else 1.0
+            stats['mode'] = mode
+            stats['efficiency'] = stats['steps_per_sec'] / (baseline['steps_per_sec'] * ideal)
+            results.append(stats)
+            print(f"{mode:6s} | ranks {ranks:3d} | grid {'x'.join(map(str, stats['grid'])):7s} | "
+                  f"{stats['particles']:8d} particles | {stats['steps_per_sec']:8.2f} steps/s | "
+                  f"efficiency {stats['efficiency']:.2f} | communication {100 * stats['communicate_fraction']:.0f}% | "
+                  f"peak {stats['peak_memory_per_rank'] / 2 ** 20:.0f} MB/rank")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
+import argparse
 import torch
-from src.utils import load_config, create_particles, print_initial_system
-from src.renderer import Renderer
+from src.utils import (load_config, create_particles, create_replicas, replica_settings, print_initial_system,
+                       make_renderer)
 from src.simulator import Simulator
 
 def main():
-    config = load_config()
+    parser = argparse.ArgumentParser(description="AE - Atomic Engine")
+    parser.add_argument('--config', default='config.yaml', help="Configuration file")
+    parser.add_argument('--resume', help="Resume from a checkpoint file")
+    args = parser.parse_args()
+    
+    config = load_config(args.config)
+    
+    if config.get('distributed', {}).get('enabled', False):
+        from src.domain import launch, run_worker
+        launch(run_worker, config['distributed']['ranks'], config)
+        return
     
     device = config['simulation']['device']
     if device == 'mps' and not torch.backends.mps.is_available():
@@ -14,14 +25,21 @@ def main():
         print("CUDA not available, falling back to CPU")
         device = 'cpu'
     
-    particles = create_particles(config, device)
+    state = None
+    if args.resume:
+        from src.checkpoint import load_checkpoint
+        particles, state = load_checkpoint(args.resume, device)
+        print(f"Resuming from {args.resume} at step {state['meta']['step']}")
+    elif config.get('replicas', {}).get('count', 1) > 1:
+        seeds, temperatures = replica_settings(config)
+        particles = create_replicas(config, device, seeds, temperatures)
+    else:
+        particles = create_particles(config, device)
     print_initial_system(particles, config)
     
-    renderer = None
-    if config['renderer']['enabled']:
-        renderer = Renderer(config['renderer'])
-    
-    simulator = Simulator(particles, config, renderer)
+    simulator = Simulator(particles, config, make_renderer(config))
+    if state is not None:
+        simulator.restore(state)
     simulator.run()
 
 if __name__ == "__main__":
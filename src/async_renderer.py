@@ -0,0 +1,145 @@
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+import numpy as np
+import torch
+from src.profiling import PHASES
+
+def read_latest(buffers, frame, latest, sequence, locks, seen):
+    # Consumer side: copy the most recently published slot under its lock; returns the sequence now shown
+    if sequence.value == seen:
+        return seen
+    slot = latest.value
+    with locks[slot]:
+        np.copyto(frame, buffers[slot])
+        return sequence.value
+
+def _render_worker(config, shm_name, n, static, integrator, latest, sequence, locks, fps, phases, counts, paused,
+                   running):
+    from src.renderer import Renderer
+    
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffers = np.ndarray((2, 2, n, 3), dtype=np.float32, buffer=shm.buf)
+    frame = np.zeros((2, n, 3), dtype=np.float32)
+    snapshot = SimpleNamespace(
+        positions=torch.from_numpy(frame[0]),
+        velocities=torch.from_numpy(frame[1]),
+        **{key: torch.from_numpy(value) for key, value in static.items()}
+    )
+    
+    renderer = Renderer(config)
+    element_counts = {}
+    seen = -1
+    try:
+        while running.value and renderer.running:
+            seen = read_latest(buffers, frame, latest, sequence, locks, seen)
+            
+            try:
+                element_counts = counts.get_nowait()
+            except queue.Empty:
+                pass
+            
+            renderer.render(snapshot, fps.value, element_counts, integrator, dict(zip(PHASES, phases[:])))
+            paused.value = renderer.paused
+    finally:
+        running.value = False
+        renderer.cleanup()
+        del buffers
+        shm.close()
+
+class AsyncRenderer:
+    def __init__(self, config):
+        self.config = config
+        self.ctx = mp.get_context('spawn')
+        
+        self._latest = self.ctx.Value('i', 0, lock=False)
+        self._sequence = self.ctx.Value('q', 0, lock=False)
+        self._locks = [self.ctx.Lock(), self.ctx.Lock()]
+        self._fps = self.ctx.Value('d', 0.0, lock=False)
+        self._phases = self.ctx.Array('d', len(PHASES), lock=False)
+        self._counts = self.ctx.Queue(maxsize=1)
+        self._paused = self.ctx.Value('b', False, lock=False)
+        self._running = self.ctx.Value('b', True, lock=False)
+        
+        self.process = None
+        self.shm = None
+        self.buffers = None
+        self.last_counts = None
+        self.published = 0
+        self.dropped = 0
+    
+    @property
+    def paused(self):
+        return bool(self._paused.value)
+    
+    @property
+    def running(self):
+        if self.process is not None and not self.process.is_alive():
+            return False
+        return bool(self._running.value)
+    
+    def allocate(self, n):
+        self.shm = shared_memory.SharedMemory(create=True, size=2 * 2 * n * 3 * 4)
+        self.buffers = torch.from_numpy(np.ndarray((2, 2, n, 3), dtype=np.float32, buffer=self.shm.buf))
+    
+    def _start(self, particles, integrator):
+        n = particles.n_particles
+        self.allocate(n)
+        
+        static = {
+            'colors': particles.colors.detach().cpu().numpy().astype('f4'),
+            'masses': particles.masses.detach().cpu().numpy().astype('f4'),
+            'charges': particles.charges.detach().cpu().numpy().astype('f4'),
+        }
+        self.process = self.ctx.Process(
+            target=_render_worker,
+            args=(self.config, self.shm.name, n, static, integrator, self._latest, self._sequence,
+                  self._locks, self._fps, self._phases, self._counts, self._paused, self._running),
+            daemon=True
+        )
+        self.process.start()
+    
+    def render(self, particles, fps, element_counts, integrator='Euler', phases=None):
+        if self.process is None:
+            self._start(particles, integrator)
+        
+        self._fps.value = fps
+        if phases:
+            self._phases[:] = [phases.get(name, 0.0) for name in PHASES]
+        if element_counts != self.last_counts:
+            try:
+                self._counts.put_nowait(element_counts)
+                self.last_counts = element_counts
+            except queue.Full:
+                pass
+        
+        self.publish(particles)
+    
+    def publish(self, particles):
+        # Write into the slot the viewer is not showing; if it is still being read, drop the frame
+        slot = 1 - self._latest.value
+        if not self._locks[slot].acquire(block=False):
+            self.dropped += 1
+            return False
+        try:
+            self.buffers[slot, 0].copy_(particles.positions)
+            self.buffers[slot, 1].copy_(particles.velocities)
+        finally:
+            self._locks[slot].release()
+        
+        self._latest.value = slot
+        self._sequence.value += 1
+        self.published += 1
+        return True
+    
+    def cleanup(self):
+        self._running.value = False
+        if self.process is not None:
+            self.process.join(timeout=5.0)
+            if self.process.is_alive():
+                self.process.terminate()
+        if self.shm is not None:
+            self.buffers = None
+            self.shm.close()
+            self.shm.unlink()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+import torch
+import yaml
+from src.particle import ParticleSystem
+
+MAGIC = b'AECKPT01'
+_ALIGN = 64
+_PARTICLE_FIELDS = ['positions', 'velocities', 'masses', 'charges', 'radii', 'colors',
+                    'epsilons', 'sigmas', 'species_id', 'pair_table', 'forces', 'slow_forces']
+
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+def config_hash(config):
+    return hashlib.sha256(yaml.safe_dump(config, sort_keys=True).encode()).hexdigest()
+
+def capture_state(simulator):
+    particles = simulator.particles
+    tensors = {name: getattr(particles, name) for name in _PARTICLE_FIELDS if getattr(particles, name) is not None}
+    tensors['rng_state'] = torch.get_rng_state()
+    if torch.cuda.is_available():
+        tensors['cuda_rng_state'] = torch.cuda.get_rng_state()
+    
+    meta = {
+        'step': simulator.step,
+        'config_hash': config_hash(simulator.config),
+        'symbols': particles.symbols,
+        'neighbor_list': None,
+    }
+    
+    neighbor_list = simulator.neighbor_list
+    if neighbor_list is not None and neighbor_list.candidates is not None:
+        tensors['neighbor_candidates'] = neighbor_list.candidates
+        tensors['neighbor_valid'] = neighbor_list.valid
+        tensors['neighbor_reference'] = neighbor_list.reference
+        meta['neighbor_list'] = {
+            'k': neighbor_list.k,
+            'capacity': neighbor_list.capacity,
+            'builds': neighbor_list.builds,
+            'queries': neighbor_list.queries,
+        }
+    
+    # Host copies are taken up front so the integrator can keep mutating its tensors while the file is written
+    return {name: t.detach().to('cpu', copy=True).contiguous() for name, t in tensors.items()}, meta
+
+def write_checkpoint(path, tensors, meta):
+    entries = {}
+    offset = 0
+    for name, t in tensors.items():
+        nbytes = t.numel() * t.element_size()
+        entries[name] = {'dtype': str(t.dtype).replace('torch.', ''), 'shape': list(t.shape),
+                         'offset': offset, 'nbytes': nbytes}
+        offset = _align(offset + nbytes)
+    
+    header = json.dumps({'meta': meta, 'tensors': entries}).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header))
+    
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, t in tensors.items():
+            f.seek(data_start + entries[name]['offset'])
+            f.write(t.reshape(-1).view(torch.uint8).numpy())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+def read_checkpoint(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an AE checkpoint")
+        header_len = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_len))
+    
+    data_start = _align(len(MAGIC) + 8 + header_len)
+    buffer = np.memmap(path, dtype=np.uint8, mode='c')
+    
+    tensors = {}
+    for name, entry in header['tensors'].items():
+        start = data_start + entry['offset']
+        raw = torch.from_numpy(buffer[start:start + entry['nbytes']])
+        tensors[name] = raw.view(getattr(torch, entry['dtype'])).reshape(entry['shape'])
+    
+    return tensors, header['meta']
+
+def load_checkpoint(path, device):
+    tensors, meta = read_checkpoint(path)
+    fields = {name: tensors[name].to(device) if name in tensors else None for name in _PARTICLE_FIELDS}
+    particles = ParticleSystem(elements=None, device=device, symbols=meta['symbols'], **fields)
+    return particles, {'tensors': tensors, 'meta': meta}
+
+class Checkpointer:
+    def __init__(self, config):
+        self.path = config.get('path', 'checkpoint.ae')
+        self.every = max(1, config.get('every', 10000))
+        self.thread = None
+        self.saved = 0
+        self.skipped = 0
+    
+    @property
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+    
+    def save(self, simulator):
+        if self.busy:
+            self.skipped += 1
+            return False
+        
+        tensors, meta = capture_state(simulator)
+        self.thread = threading.Thread(target=self._write, args=(tensors, meta), daemon=True)
+        self.thread.start()
+        return True
+    
+    def _write(self, tensors, meta):
+        write_checkpoint(self.path, tensors, meta)
+        self.saved += 1
+    
+    def close(self):
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,395 @@
+import copy
+import os
+import socket
+import time
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from dataclasses import replace
+from functools import partial
+from src.physics import apply_boundary, compute_forces, find_k_nearest, find_k_nearest_cells, make_force_kernel
+
+_OWNED_FIELDS = ('positions', 'velocities', 'masses', 'charges', 'radii', 'colors', 'epsilons', 'sigmas')
+_GHOST_FIELDS = ('positions', 'charges', 'epsilons', 'sigmas')
+
+def processor_grid(world_size, box_size):
+    # The factorization with the smallest subdomain surface exchanges the fewest halo atoms
+    best = None
+    for nx in range(1, world_size + 1):
+        for ny in range(1, world_size // nx + 1):
+            if world_size % (nx * ny):
+                continue
+            grid = (nx, ny, world_size // (nx * ny))
+            wx, wy, wz = (size / n for size, n in zip(box_size, grid))
+            area = wx * wy + wy * wz + wx * wz
+            if best is None or area < best[0]:
+                best = (area, grid)
+    return best[1]
+
+def _pack(particles, fields, ids, mask):
+    columns = []
+    for name in fields:
+        values = getattr(particles, name)[mask]
+        columns.append(values.reshape(len(values), values.shape[1:].numel()).double())
+    columns.append(particles.species_id[mask].unsqueeze(1).double())
+    if ids is not None:
+        columns.append(ids[mask].unsqueeze(1).double())
+    return torch.cat(columns, dim=1)
+
+def _unpack(buffer, template, fields, with_ids):
+    values = {}
+    offset = 0
+    for name in fields:
+        reference = getattr(template, name)
+        width = reference.shape[1:].numel()
+        values[name] = buffer[:, offset:offset + width].reshape((-1,) + reference.shape[1:]).to(reference.dtype)
+        offset += width
+    values['species_id'] = buffer[:, offset].long()
+    ids = buffer[:, offset + 1].long() if with_ids else None
+    return values, ids
+
+class DomainDecomposition:
+    def __init__(self, box_size, halo, periodic=False, grid=None):
+        self.rank = dist.get_rank()
+        self.world_size = dist.get_world_size()
+        self.box_size = list(box_size)
+        self.halo = halo
+        self.periodic = periodic
+        self.grid = tuple(grid) if grid else processor_grid(self.world_size, self.box_size)
+        if self.grid[0] * self.grid[1] * self.grid[2] != self.world_size:
+            raise ValueError(f"Processor grid {self.grid} does not match {self.world_size} ranks")
+
+        self.coords = (self.rank // (self.grid[1] * self.grid[2]), (self.rank // self.grid[2]) % self.grid[1],
+                       self.rank % self.grid[2])
+        self.width = [size / n for size, n in zip(self.box_size, self.grid)]
+        self.lower = [c * w for c, w in zip(self.coords, self.width)]
+        self.upper = [l + w for l, w in zip(self.lower, self.width)]
+        for axis in range(3):
+            if (self.grid[axis] > 1 or periodic) and halo > self.width[axis]:
+                raise ValueError(f"Halo {halo} exceeds the subdomain width {self.width[axis]:.2f} along axis {axis}")
+        self.sent = 0
+        self.received = 0
+
+    def rank_of(self, coords):
+        return (coords[0] * self.grid[1] + coords[1]) * self.grid[2] + coords[2]
+
+    def neighbor(self, axis, direction):
+        coords = list(self.coords)
+        coords[axis] += direction
+        if not 0 <= coords[axis] < self.grid[axis]:
+            if not self.periodic:
+                return None
+            coords[axis] %= self.grid[axis]
+        return self.rank_of(coords)
+
+    def owned_mask(self, positions):
+        mask = torch.ones(len(positions), dtype=torch.bool, device=positions.device)
+        for axis in range(3):
+            x = positions[:, axis]
+            last = self.coords[axis] == self.grid[axis] - 1
+            mask &= (x >= self.lower[axis]) & ((x <= self.upper[axis]) if last else (x < self.upper[axis]))
+        return mask
+
+    def _exchange(self, axis, outgoing):
+        # outgoing maps direction (+1/-1) to a packed buffer; returns what the opposite neighbors sent us
+        incoming = []
+        requests = []
+        pending = []
+        for direction, buffer in outgoing.items():
+            peer = self.neighbor(axis, direction)
+            if peer is None:
+                continue
+            if peer == self.rank:
+                incoming.append(buffer)
+                continue
+            tag = 4 * axis + 2 * (direction > 0)
+            size = torch.tensor([len(buffer), buffer.shape[1]], dtype=torch.long)
+            buffer = buffer.cpu().contiguous()
+            pending.extend([size, buffer])
+            requests.append(dist.isend(size, peer, tag=tag))
+            if len(buffer) > 0:
+                requests.append(dist.isend(buffer, peer, tag=tag + 1))
+            self.sent += len(buffer)
+
+        for direction in outgoing:
+            peer = self.neighbor(axis, -direction)
+            if peer is None or peer == self.rank:
+                continue
+            tag = 4 * axis + 2 * (direction > 0)
+            size = torch.empty(2, dtype=torch.long)
+            dist.recv(size, peer, tag=tag)
+            buffer = torch.empty(int(size[0]), int(size[1]), dtype=torch.float64)
+            if len(buffer) > 0:
+                dist.recv(buffer, peer, tag=tag + 1)
+            incoming.append(buffer)
+            self.received += len(buffer)
+
+        for request in requests:
+            request.wait()
+        return incoming
+
+    def populate(self, config, seed=0, device='cpu'):
+        # Each rank places only its own share of every species inside its subdomain from a per-rank seed, so no
+        # rank ever holds the global system; global ids are species-major as in create_particles
+        from src.utils import create_particles, load_element_table
+        local_config = copy.deepcopy(config)
+        particle_config = local_config['particles']
+        counts = {}
+        ids = []
+        start = 0
+        for symbol, total in config['particles']['count'].items():
+            share, extra = divmod(total, self.world_size)
+            counts[symbol] = share + (self.rank < extra)
+            first = start + self.rank * share + min(self.rank, extra)
+            ids.append(torch.arange(first, first + counts[symbol], device=device))
+            start += total
+        particle_config['count'] = counts
+
+        # Poisson placement keeps min_distance / 2 off every face, so points of neighboring subdomains stay apart too
+        margin = 0.0
+        if particle_config.get('initial_state', 'random') == 'poisson':
+            table = load_element_table()
+            sigmas = [table['lj_sigma'][table['index'][symbol]] for symbol in counts]
+            particle_config['min_distance'] = particle_config.get('min_distance') or float(max(sigmas))
+            margin = 0.5 * particle_config['min_distance']
+        local_config['boundary']['size'] = [w - 2 * margin for w in self.width]
+        local_config['boundary']['type'] = 'box'
+
+        torch.manual_seed(seed * 1000003 + self.rank)
+        particles = create_particles(local_config, device)
+        particles.positions += torch.tensor([l + margin for l in self.lower], device=device)
+        return particles, torch.cat(ids)
+
+    def distribute(self, particles):
+        # Masks a global system down to this subdomain; every rank holds the whole system, so this is for small
+        # systems and tests only (populate builds the local share directly)
+        mask = self.owned_mask(particles.positions)
+        ids = torch.nonzero(mask).squeeze(1)
+        local = replace(particles, **{name: getattr(particles, name)[mask] for name in _OWNED_FIELDS},
+                        species_id=particles.species_id[mask], elements=None, forces=None, slow_forces=None)
+        return local, ids
+
+    def migrate(self, particles, ids):
+        # Positions are already inside the global box (walls or periodic wrap), so the wrapped offset from the
+        # subdomain center says which face an atom left through; axes are swept in turn to cover edges and corners
+        device = particles.positions.device
+        for axis in range(3):
+            center = self.lower[axis] + 0.5 * self.width[axis]
+            offset = particles.positions[:, axis] - center
+            if self.periodic:
+                offset = offset - self.box_size[axis] * torch.round(offset / self.box_size[axis])
+
+            leaving = {1: offset >= 0.5 * self.width[axis], -1: offset < -0.5 * self.width[axis]}
+            for direction in (1, -1):
+                if self.neighbor(axis, direction) is None:
+                    leaving[direction] = torch.zeros_like(leaving[direction])
+
+            outgoing = {direction: _pack(particles, _OWNED_FIELDS, ids, mask) for direction, mask in leaving.items()}
+            incoming = self._exchange(axis, outgoing)
+
+            stay = ~(leaving[1] | leaving[-1])
+            buffers = [_pack(particles, _OWNED_FIELDS, ids, stay)] + [buffer.to(device) for buffer in incoming]
+            values, ids = _unpack(torch.cat(buffers), particles, _OWNED_FIELDS, with_ids=True)
+            particles = replace(particles, **values, elements=None, forces=None, slow_forces=None)
+
+        return particles, ids
+
+    def ghosts(self, particles):
+        # Atoms within halo of a face are copied to that neighbor, shifted by the box length across periodic faces;
+        # ghosts received on earlier axes are forwarded so edge and corner images arrive as well
+        device = particles.positions.device
+        owned = torch.ones(particles.n_particles, dtype=torch.bool, device=device)
+        current = _pack(particles, _GHOST_FIELDS, None, owned)
+        for axis in range(3):
+            x = current[:, axis]
+            outgoing = {}
+            for direction in (1, -1):
+                if direction > 0:
+                    mask = x > self.upper[axis] - self.halo
+                    wraps = self.coords[axis] == self.grid[axis] - 1
+                else:
+                    mask = x < self.lower[axis] + self.halo
+                    wraps = self.coords[axis] == 0
+                buffer = current[mask].clone()
+                if wraps:
+                    buffer[:, axis] -= direction * self.box_size[axis]
+                outgoing[direction] = buffer
+
+            incoming = self._exchange(axis, outgoing)
+            current = torch.cat([current] + [buffer.to(device) for buffer in incoming])
+
+        ghosts, _ = _unpack(current[particles.n_particles:], particles, _GHOST_FIELDS, with_ids=False)
+        return ghosts
+
+    def all_reduce(self, value, op=dist.ReduceOp.SUM):
+        tensor = torch.as_tensor(value, dtype=torch.float64).clone()
+        dist.all_reduce(tensor, op=op)
+        return tensor
+
+    def gather(self, particles, ids):
+        # Rank-ordered concatenation of (ids, positions, velocities), sorted by global id; collective, use sparingly
+        local = torch.cat([ids.unsqueeze(1).double(), particles.positions.double(), particles.velocities.double()],
+                          dim=1).cpu()
+        sizes = [torch.zeros(1, dtype=torch.long) for _ in range(self.world_size)]
+        dist.all_gather(sizes, torch.tensor([len(local)]))
+        capacity = int(max(sizes)[0])
+        padded = torch.zeros(capacity, local.shape[1], dtype=torch.float64)
+        padded[:len(local)] = local
+        gathered = [torch.empty_like(padded) for _ in range(self.world_size)]
+        dist.all_gather(gathered, padded)
+        rows = torch.cat([block[:int(size[0])] for block, size in zip(gathered, sizes)])
+        rows = rows[torch.argsort(rows[:, 0])]
+        return rows[:, 0].long(), rows[:, 1:4], rows[:, 4:7]
+
+class DomainSimulator:
+    def __init__(self, particles, ids, config, domain):
+        # Forces follow physics.k_neighbors, neighbor_search, force_backend and precision; options that would
+        # change them are rejected, and the integrator and skin list, which only change the path, fall back
+        physics = config['physics']
+        if physics.get('electrostatics', 'knn') == 'pme':
+            raise ValueError("Distributed runs support electrostatics: knn only, not pme")
+        if physics.get('force_mode', 'knn') != 'knn':
+            raise ValueError(f"Distributed runs support force_mode: knn only, not {physics['force_mode']}")
+        if domain.rank == 0:
+            if config['simulation']['integrator'].lower() not in ('verlet', 'velocity_verlet'):
+                print(f"Warning: distributed runs integrate with velocity Verlet, "
+                      f"not {config['simulation']['integrator']}")
+            if physics.get('neighbor_skin', 0.0) > 0:
+                print("Warning: distributed runs search neighbors every step; neighbor_skin is ignored")
+        
+        self.particles = particles
+        self.ids = ids
+        self.config = config
+        self.domain = domain
+
+        self.dt = config['simulation']['dt']
+        self.k = config['physics']['k_neighbors']
+        self.coulomb_k = config['physics']['coulomb_constant']
+        self.boundary_size = config['boundary']['size']
+        self.restitution = config['boundary']['restitution']
+        self.use_thermostat = config['physics']['thermostat'] != "none"
+        self.target_temp = config['physics']['temperature']
+        self.thermostat_tau = config['physics']['thermostat_tau']
+        self.kernel = make_force_kernel(config['physics'].get('force_backend', 'eager'),
+                                        config['physics'].get('precision', 'float32'))
+
+        # Ghosts are explicit periodic images, so the local search runs on a plain box around the subdomain
+        self.origin = torch.tensor([l - domain.halo for l in domain.lower], device=particles.positions.device,
+                                   dtype=particles.positions.dtype)
+        extent = [w + 2 * domain.halo for w in domain.width]
+        if config['physics'].get('neighbor_search', 'brute') == 'cell':
+            self.neighbor_fn = partial(find_k_nearest_cells, box_size=extent, cell_size=config['physics'].get('cell_size'))
+        else:
+            self.neighbor_fn = find_k_nearest
+
+        self.step = 0
+        self.n_total = int(domain.all_reduce(particles.n_particles))
+        self.communicate_time = 0.0
+        self.particles.forces = self.compute_forces()
+
+    def compute_forces(self):
+        particles = self.particles
+        start = time.perf_counter()
+        ghosts = self.domain.ghosts(particles)
+        self.communicate_time += time.perf_counter() - start
+
+        combined = replace(particles, elements=None, forces=None, slow_forces=None,
+                           positions=torch.cat([particles.positions, ghosts['positions']]) - self.origin,
+                           charges=torch.cat([particles.charges, ghosts['charges']]),
+                           epsilons=torch.cat([particles.epsilons, ghosts['epsilons']]),
+                           sigmas=torch.cat([particles.sigmas, ghosts['sigmas']]),
+                           species_id=torch.cat([particles.species_id, ghosts['species_id']]))
+        searched = []
+        
+        def neighbor_fn(positions, k):
+            distances, indices = self.neighbor_fn(positions, k)
+            searched.append(distances)
+            return distances, indices
+        
+        forces = compute_forces(combined, self.k, self.coulomb_k, neighbor_fn, kernel=self.kernel)
+        self.check_halo(searched[-1][:particles.n_particles])
+        return forces[:particles.n_particles]
+    
+    def check_halo(self, distances):
+        # Ghosts only cover the halo, so an owned atom whose k-th local neighbor lies farther out may be missing
+        # a true neighbor on another rank and its forces would differ from a serial run; collective on every rank
+        reach = distances[:, -1].max() if distances.numel() else 0.0
+        reach = float(self.domain.all_reduce(reach, dist.ReduceOp.MAX))
+        if reach > self.domain.halo:
+            raise ValueError(f"k-th neighbor distance {reach:.2f} exceeds the halo {self.domain.halo}; "
+                             f"raise distributed.halo or lower physics.k_neighbors")
+
+    def temperature(self, k_b=1.380649e-23):
+        return 2.0 / 3.0 * float(self.domain.all_reduce(self.particles.kinetic_energy())) / (self.n_total * k_b)
+
+    def advance(self):
+        particles = self.particles
+        inv_mass = 1.0 / particles.masses.unsqueeze(1)
+        particles.velocities += 0.5 * self.dt * particles.forces * inv_mass
+        particles.positions += self.dt * particles.velocities
+        apply_boundary(particles, self.boundary_size, self.restitution, self.domain.periodic)
+
+        start = time.perf_counter()
+        self.particles, self.ids = self.domain.migrate(particles, self.ids)
+        self.communicate_time += time.perf_counter() - start
+
+        particles = self.particles
+        particles.forces = self.compute_forces()
+        particles.velocities += 0.5 * self.dt * particles.forces / particles.masses.unsqueeze(1)
+
+        if self.use_thermostat:
+            current_temp = self.temperature()
+            if current_temp > 0:
+                particles.velocities *= (1.0 + (self.dt / self.thermostat_tau) * (self.target_temp / current_temp - 1.0)) ** 0.5
+
+        self.step += 1
+
+    def run(self, steps):
+        start = time.perf_counter()
+        communicate_start = self.communicate_time
+        for _ in range(steps):
+            self.advance()
+        elapsed = self.domain.all_reduce(time.perf_counter() - start, dist.ReduceOp.MAX).item()
+        communicate = self.domain.all_reduce(self.communicate_time - communicate_start, dist.ReduceOp.MAX).item()
+        return {
+            'ranks': self.domain.world_size,
+            'grid': list(self.domain.grid),
+            'particles': self.n_total,
+            'steps': steps,
+            'elapsed': elapsed,
+            'steps_per_sec': steps / max(elapsed, 1e-9),
+            'communicate_fraction': communicate / max(elapsed, 1e-9),
+            'max_local': int(self.domain.all_reduce(self.particles.n_particles, dist.ReduceOp.MAX)),
+        }
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _bootstrap(rank, world_size, port, fn, args):
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+    torch.set_num_threads(1)
+    dist.init_process_group('gloo', init_method=f"tcp://127.0.0.1:{port}", rank=rank, world_size=world_size)
+    try:
+        fn(rank, world_size, *args)
+    finally:
+        dist.destroy_process_group()
+
+def launch(fn, world_size, *args):
+    # fn(rank, world_size, *args) runs in world_size local processes joined by a gloo process group
+    mp.spawn(_bootstrap, args=(world_size, _free_port(), fn, args), nprocs=world_size, join=True)
+
+def run_worker(rank, world_size, config, seed=0, steps=None):
+    distributed = config.get('distributed', {})
+    domain = DomainDecomposition(config['boundary']['size'], distributed.get('halo', 8.0),
+                                 config['boundary'].get('type', 'box') == 'periodic', distributed.get('grid'))
+    local, ids = domain.populate(config, seed)
+    simulator = DomainSimulator(local, ids, config, domain)
+    stats = simulator.run(steps or config['simulation']['steps'])
+    temperature = simulator.temperature()
+
+    if rank == 0:
+        print(f"Ranks {world_size} (grid {'x'.join(map(str, domain.grid))}) | {stats['particles']} particles | "
+              f"{stats['steps_per_sec']:.1f} steps/s | T: {temperature:.1f} K")
+    return stats
@@ -0,0 +1,121 @@
+import torch
+from src.physics import compute_forces, confine
+
+class StepEngine:
+    def __init__(self, simulator, steps_per_call, cuda_graph=True):
+        self.simulator = simulator
+        self.steps_per_call = steps_per_call
+        self.graph = None
+        self.sampled_graph = None
+        
+        self.boundary_tensor = simulator.boundary_tensor
+        self.force_kwargs = dict(simulator.force_kwargs)
+        if self.force_kwargs.get('box_size') is not None:
+            self.force_kwargs['box_size'] = self.boundary_tensor
+        
+        if cuda_graph and self.graph_compatible():
+            self._capture()
+    
+    def graph_compatible(self):
+        sim = self.simulator
+        return (sim.particles.positions.is_cuda
+                and sim.integrator_name.lower() in ('verlet', 'velocity_verlet')
+                and sim.neighbor_list is None
+                and sim.config['physics'].get('neighbor_search', 'brute') == 'brute'
+                and not self.force_kwargs.get('pairwise', False))
+    
+    def _forces(self, tally=None):
+        sim = self.simulator
+        return compute_forces(sim.particles, sim.k, sim.coulomb_k, tally=tally, **self.force_kwargs)
+    
+    def _device_step(self, tally=None):
+        # Kick-drift-confine-force-kick: walls act during the drift, so the end-of-step forces are
+        # always evaluated at the confined positions and never need host-side invalidation
+        sim = self.simulator
+        particles = sim.particles
+        particles.velocities.add_(self.forces * self.inv_mass, alpha=0.5 * sim.dt)
+        particles.positions.add_(particles.velocities, alpha=sim.dt)
+        confine(particles.positions, particles.velocities, self.boundary_tensor, sim.restitution, sim.periodic)
+        
+        self.forces.copy_(self._forces(tally))
+        particles.velocities.add_(self.forces * self.inv_mass, alpha=0.5 * sim.dt)
+        
+        if sim.use_thermostat:
+            particles.apply_thermostat(sim.target_temp, sim.thermostat_tau, sim.dt)
+    
+    def _record(self, tally):
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            for step in range(self.steps_per_call):
+                self._device_step(tally if step == self.steps_per_call - 1 else None)
+        return graph
+    
+    def _capture(self):
+        particles = self.simulator.particles
+        tally = self.simulator.tally
+        self.inv_mass = (1.0 / particles.masses).unsqueeze(1)
+        self.forces = self._forces()
+        saved = [particles.positions.clone(), particles.velocities.clone(), self.forces.clone()]
+        
+        # Warm up on a side stream so lazy allocations happen before capture, then rewind the state
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                self._device_step()
+            if tally is not None:
+                self._device_step(tally)
+        torch.cuda.current_stream().wait_stream(stream)
+        
+        # With observables a second graph tallies its last step; the tally then holds that graph's output
+        # tensors, which every replay of it refreshes in place
+        self.graph = self._record(None)
+        if tally is not None:
+            self.sampled_graph = self._record(tally)
+        
+        for tensor, value in zip([particles.positions, particles.velocities, self.forces], saved):
+            tensor.copy_(value)
+    
+    def _steps(self, tally):
+        for step in range(self.steps_per_call):
+            self.simulator.step_once(tally if step == self.steps_per_call - 1 else None)
+    
+    def run(self, tally=None):
+        # With a tally the last step of the call records energy and virial at the positions it ends on
+        if self.graph is not None:
+            with self.simulator.timer.phase('integration'):
+                (self.graph if tally is None else self.sampled_graph).replay()
+            self.simulator.particles.forces = self.forces
+            return self.steps_per_call
+        
+        if tally is not None:
+            tally.reset()
+        sim = self.simulator
+        neighbor_list = sim.neighbor_list
+        k = min(sim.k, sim.particles.n_particles - 1)
+        if neighbor_list is None or k < 1:
+            self._steps(tally)
+            return self.steps_per_call
+        
+        # The skin list checks displacements on the host once for the whole call instead of once per step. If an
+        # atom still outruns the lookahead, the call is replayed from its start with the per-query check
+        particles = sim.particles
+        saved = (particles.positions.clone(), particles.velocities.clone(), particles.forces, particles.slow_forces)
+        with sim.timer.phase('neighbor_search'):
+            accelerations = None
+            if particles.forces is not None:
+                forces = particles.forces if particles.slow_forces is None else particles.forces + particles.slow_forces
+                accelerations = forces / particles.masses.unsqueeze(-1)
+            neighbor_list.schedule(particles.positions, particles.velocities, k, self.steps_per_call * sim.dt,
+                                   accelerations)
+        try:
+            self._steps(tally)
+        finally:
+            breached = neighbor_list.unschedule(particles.positions)
+        
+        if breached:
+            particles.positions.copy_(saved[0])
+            particles.velocities.copy_(saved[1])
+            particles.forces, particles.slow_forces = saved[2], saved[3]
+            self._steps(tally)
+        return self.steps_per_call
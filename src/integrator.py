@@ -1,26 +1,112 @@
 import torch
-from src.physics import compute_forces
+from src.physics import compute_forces, find_k_nearest
 
-def euler_step(particles, dt, k, coulomb_k):
-    f = compute_forces(particles, k, coulomb_k)
+def _forces_at(particles, positions, k, coulomb_k, **force_kwargs):
+    current = particles.positions
+    particles.positions = positions
+    try:
+        return compute_forces(particles, k, coulomb_k, **force_kwargs)
+    finally:
+        particles.positions = current
+
+def _current_forces(particles, k, coulomb_k, **force_kwargs):
+    if particles.forces is None:
+        particles.forces = compute_forces(particles, k, coulomb_k, **force_kwargs)
+    return particles.forces
+
+def _constrain(particles, constrain):
+    # constrain(particles) applies walls or periodic wrapping right after a drift, before forces are taken there
+    if constrain is not None:
+        constrain(particles)
+
+def _end_forces(particles, k, coulomb_k, tally, **force_kwargs):
+    # Euler and RK4 never evaluate at the new positions; a sampled step takes the tallied forces there instead,
+    # and caches them for the next step so sampling costs no extra evaluation
+    if tally is None:
+        particles.invalidate_forces()
+    else:
+        particles.forces = compute_forces(particles, k, coulomb_k, tally=tally, **force_kwargs)
+
+def euler_step(particles, dt, k, coulomb_k, constrain=None, tally=None, **force_kwargs):
+    f = _current_forces(particles, k, coulomb_k, **force_kwargs)
     a = f / particles.masses.unsqueeze(1)
     
     particles.velocities += a * dt
     particles.positions += particles.velocities * dt
+    _constrain(particles, constrain)
+    _end_forces(particles, k, coulomb_k, tally, **force_kwargs)
     
     return particles
 
-def velocity_verlet_step(particles, dt, k, coulomb_k):
-    f = compute_forces(particles, k, coulomb_k)
-    a = f / particles.masses.unsqueeze(1)
+def velocity_verlet_step(particles, dt, k, coulomb_k, constrain=None, tally=None, **force_kwargs):
+    # Kick-drift-constrain-kick: the cached end-of-step forces are always taken at the constrained positions
+    inv_mass = 1.0 / particles.masses.unsqueeze(1)
+    f = _current_forces(particles, k, coulomb_k, **force_kwargs)
+    
+    particles.velocities += 0.5 * dt * f * inv_mass
+    particles.positions += particles.velocities * dt
+    _constrain(particles, constrain)
+    
+    f_new = compute_forces(particles, k, coulomb_k, tally=tally, **force_kwargs)
+    particles.velocities += 0.5 * dt * f_new * inv_mass
+    particles.forces = f_new
+    
+    return particles
+
+def rk4_step(particles, dt, k, coulomb_k, constrain=None, tally=None, **force_kwargs):
+    # Fourth-order Runge-Kutta-Nystrom: x'' = a(x) needs three force evaluations per step. None of them is taken
+    # at the new positions, so the cache is invalidated and the next step recomputes a1 (unless sampled)
+    inv_mass = 1.0 / particles.masses.unsqueeze(1)
+    x = particles.positions
+    v = particles.velocities
+    
+    a1 = _current_forces(particles, k, coulomb_k, **force_kwargs) * inv_mass
+    a2 = _forces_at(particles, x + 0.5 * dt * v + 0.125 * dt * dt * a1, k, coulomb_k, **force_kwargs) * inv_mass
+    a3 = _forces_at(particles, x + dt * v + 0.5 * dt * dt * a2, k, coulomb_k, **force_kwargs) * inv_mass
+    
+    particles.positions += dt * v + (dt * dt / 6.0) * (a1 + 2.0 * a2)
+    particles.velocities += (dt / 6.0) * (a1 + 4.0 * a2 + a3)
+    _constrain(particles, constrain)
+    _end_forces(particles, k, coulomb_k, tally, **force_kwargs)
+    
+    return particles
+
+def respa_step(particles, dt, k, coulomb_k, inner_steps=4, constrain=None, neighbor_fn=find_k_nearest, tally=None,
+               **force_kwargs):
+    # r-RESPA: PME reciprocal-space (slow) kicks bracket inner_steps velocity Verlet sub-steps driven by the short-range
+    # forces, LJ plus real-space Coulomb, which change as fast as LJ does near contacts. Without a mesh the slow group
+    # is empty. dt is the outer step, so it only pays off with dt raised to about inner_steps times the Verlet step.
+    # One neighbor query per outer step serves every evaluation in it, at the moved positions.
+    inv_mass = 1.0 / particles.masses.unsqueeze(1)
+    inner_dt = dt / inner_steps
+    neighbors = neighbor_fn(particles.positions, min(k, particles.n_particles - 1))
+    force_kwargs['neighbor_fn'] = lambda positions, k: neighbors
+    
+    if particles.slow_forces is None:
+        particles.slow_forces = compute_forces(particles, k, coulomb_k, terms='long', **force_kwargs)
+    if particles.forces is None:
+        particles.forces = compute_forces(particles, k, coulomb_k, terms='short', **force_kwargs)
     
-    particles.positions += particles.velocities * dt + 0.5 * a * dt * dt
+    particles.velocities += 0.5 * dt * particles.slow_forces * inv_mass
     
-    f_new = compute_forces(particles, k, coulomb_k)
-    a_new = f_new / particles.masses.unsqueeze(1)
+    # A sampled step tallies both groups at the end positions, in the last short and the closing long evaluation
+    for step in range(inner_steps):
+        particles.velocities += 0.5 * inner_dt * particles.forces * inv_mass
+        particles.positions += inner_dt * particles.velocities
+        _constrain(particles, constrain)
+        particles.forces = compute_forces(particles, k, coulomb_k, terms='short',
+                                          tally=tally if step == inner_steps - 1 else None, **force_kwargs)
+        particles.velocities += 0.5 * inner_dt * particles.forces * inv_mass
     
-    particles.velocities += 0.5 * (a + a_new) * dt
+    particles.slow_forces = compute_forces(particles, k, coulomb_k, terms='long', tally=tally, **force_kwargs)
+    particles.velocities += 0.5 * dt * particles.slow_forces * inv_mass
     
     return particles
 
-rk4_step = velocity_verlet_step
+INTEGRATORS = {
+    'euler': euler_step,
+    'verlet': velocity_verlet_step,
+    'velocity_verlet': velocity_verlet_step,
+    'rk4': rk4_step,
+    'respa': respa_step,
+}
@@ -0,0 +1,61 @@
+import torch
+from src.physics import compute_forces, confine
+
+def fire_minimize(particles, k, coulomb_k, boundary_size, periodic=False, force_tol=1.0, max_iter=1000, dt=0.1,
+                  dt_max=None, max_step=0.2, n_min=5, f_inc=1.1, f_dec=0.5, alpha_start=0.1, f_alpha=0.99,
+                  **force_kwargs):
+    # FIRE (Bitzek et al. 2006): damped MD that steers velocities along the force and restarts on uphill motion.
+    # dt, alpha and the restart counter are per replica so batched systems relax independently.
+    positions = particles.positions
+    batch_shape = positions.shape[:-2]
+    expand = batch_shape + (1, 1)
+    options = {'device': positions.device, 'dtype': positions.dtype}
+
+    dt_max = dt_max or 10.0 * dt
+    step = torch.full(batch_shape, dt, **options)
+    alpha = torch.full(batch_shape, alpha_start, **options)
+    positive_steps = torch.zeros(batch_shape, dtype=torch.long, device=positions.device)
+    velocities = torch.zeros_like(positions)
+    inv_mass = 1.0 / particles.masses.unsqueeze(-1)
+    boundary_tensor = torch.tensor(boundary_size, **options)
+
+    def max_force(forces):
+        return torch.linalg.norm(forces, dim=-1).amax(dim=-1)
+
+    forces = compute_forces(particles, k, coulomb_k, **force_kwargs)
+    initial_force = max_force(forces)
+    iterations = 0
+    while iterations < max_iter and bool((max_force(forces) > force_tol).any()):
+        power = torch.sum(forces * velocities, dim=(-2, -1))
+        v_norm = torch.linalg.norm(velocities, dim=(-2, -1), keepdim=True)
+        f_norm = torch.linalg.norm(forces, dim=(-2, -1), keepdim=True)
+        a = alpha.reshape(expand)
+        velocities = (1.0 - a) * velocities + a * v_norm * forces / torch.clamp(f_norm, min=1e-12)
+
+        uphill = power <= 0
+        accelerate = ~uphill & (positive_steps > n_min)
+        step = torch.where(uphill, step * f_dec, torch.where(accelerate, torch.clamp(step * f_inc, max=dt_max), step))
+        alpha = torch.where(uphill, torch.full_like(alpha, alpha_start), torch.where(accelerate, alpha * f_alpha, alpha))
+        positive_steps = torch.where(uphill, torch.zeros_like(positive_steps), positive_steps + 1)
+        velocities = torch.where(uphill.reshape(expand), torch.zeros_like(velocities), velocities)
+
+        # Semi-implicit Euler with the largest atomic move capped, so clamped overlaps cannot fling atoms apart
+        dt_view = step.reshape(expand)
+        velocities = velocities + dt_view * forces * inv_mass
+        displacement = dt_view * velocities
+        largest = torch.linalg.norm(displacement, dim=-1).amax(dim=-1).reshape(expand)
+        displacement = displacement * torch.clamp(max_step / torch.clamp(largest, min=1e-12), max=1.0)
+
+        particles.positions += displacement
+        confine(particles.positions, velocities, boundary_tensor, 0.0, periodic)
+        forces = compute_forces(particles, k, coulomb_k, **force_kwargs)
+        iterations += 1
+
+    particles.invalidate_forces()
+    final_force = max_force(forces)
+    return {
+        'iterations': iterations,
+        'converged': bool((final_force <= force_tol).all()),
+        'initial_max_force': initial_force.tolist(),
+        'max_force': final_force.tolist(),
+    }
@@ -0,0 +1,98 @@
+import torch
+from src.physics import find_k_nearest, gather_neighbors, minimum_image
+
+# Margin on the scheduled lookahead for what extrapolation misses: changing forces and thermostat rescaling
+LOOKAHEAD_SAFETY = 2.0
+
+class NeighborList:
+    def __init__(self, skin, search_fn=find_k_nearest, box_size=None):
+        self.skin = skin
+        self.search_fn = search_fn
+        self.box_size = box_size
+        
+        self.candidates = None
+        self.valid = None
+        self.reference = None
+        self.k = None
+        self.capacity = None
+        self.scheduled = False
+        self.peak = None
+        
+        self.builds = 0
+        self.queries = 0
+    
+    @property
+    def rebuild_rate(self):
+        return self.builds / max(self.queries, 1)
+    
+    def max_displacement(self, positions):
+        return torch.max(torch.norm(minimum_image(positions - self.reference, self.box_size), dim=-1))
+    
+    def needs_rebuild(self, positions, k):
+        if self.candidates is None or k != self.k or positions.shape != self.reference.shape:
+            return True
+        if self.scheduled:
+            return False
+        return bool(self.max_displacement(positions) > 0.5 * self.skin)
+    
+    def schedule(self, positions, velocities, k, duration, accelerations=None):
+        # One host check ahead of several steps: rebuild now unless every atom, extrapolated from its current speed
+        # and acceleration, stays within skin/2 of the reference for duration. Queries then skip the host check and
+        # only track the largest displacement on the device, which unschedule() reports
+        if self.candidates is None or k != self.k or positions.shape != self.reference.shape:
+            self.build(positions, k)
+        else:
+            travel = duration * torch.max(torch.norm(velocities, dim=-1))
+            if accelerations is not None:
+                travel = travel + 0.5 * duration ** 2 * torch.max(torch.norm(accelerations, dim=-1))
+            if bool(self.max_displacement(positions) + LOOKAHEAD_SAFETY * travel > 0.5 * self.skin):
+                self.build(positions, k)
+        self.peak = torch.zeros((), device=positions.device, dtype=positions.dtype)
+        self.scheduled = True
+    
+    def unschedule(self, positions=None):
+        # True when a scheduled query (or the final positions, if given) saw an atom beyond skin/2,
+        # so its candidates may have missed a neighbor
+        self.scheduled = False
+        if positions is not None and positions.shape == self.reference.shape:
+            self.peak = torch.maximum(self.peak, self.max_displacement(positions))
+        return bool(self.peak > 0.5 * self.skin)
+    
+    def build(self, positions, k):
+        n = positions.shape[-2]
+        capacity = min(max(self.capacity or 2 * k, k), n - 1)
+        
+        # The k-th neighbor and any outsider can each move skin/2 before a rebuild,
+        # so every particle within r_k + 2*skin is kept as a candidate
+        while True:
+            distances, indices = self.search_fn(positions, capacity)
+            cutoff = distances[..., k - 1:k] + 2.0 * self.skin
+            if capacity == n - 1 or bool(torch.all(distances[..., -1] > cutoff.squeeze(-1))):
+                break
+            capacity = min(2 * capacity, n - 1)
+        
+        valid = distances <= cutoff
+        width = max(int(valid.sum(dim=-1).max()), k)
+        
+        self.candidates = indices[..., :width].contiguous()
+        self.valid = valid[..., :width].contiguous()
+        self.reference = positions.clone()
+        self.k = k
+        self.capacity = capacity
+        self.builds += 1
+    
+    def __call__(self, positions, k):
+        if k < 1:
+            return self.search_fn(positions, k)
+        
+        if self.needs_rebuild(positions, k):
+            self.build(positions, k)
+        elif self.scheduled:
+            self.peak = torch.maximum(self.peak, self.max_displacement(positions))
+        self.queries += 1
+        
+        pos_diff = minimum_image(gather_neighbors(positions, self.candidates) - positions.unsqueeze(-2), self.box_size)
+        distances = torch.norm(pos_diff, dim=-1)
+        distances = distances.masked_fill(~self.valid, float('inf'))
+        knn_distances, slots = torch.topk(distances, k, largest=False, dim=-1)
+        return knn_distances, torch.gather(self.candidates, -1, slots)
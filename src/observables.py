@@ -0,0 +1,157 @@
+import json
+import math
+import torch
+from src.physics import minimum_image
+
+KCAL_PER_MOL_J = 4184.0 / 6.02214076e23
+BAR_PER_KCAL_MOL_A3 = KCAL_PER_MOL_J / 1e-30 / 1e5
+
+class EnergyTally:
+    # Filled by compute_forces in the same pass as the forces; split integrators (RESPA) record each term separately
+    def __init__(self):
+        self.terms = {}
+    
+    def reset(self):
+        self.terms = {}
+
+    def record(self, term, potential, virial):
+        self.terms[term] = (potential, virial)
+
+    def ready(self):
+        return bool(self.terms)
+
+    def potential(self):
+        return sum(potential for potential, _ in self.terms.values())
+
+    def virial(self):
+        return sum(virial for _, virial in self.terms.values())
+
+class Observables:
+    def __init__(self, config, particles, box_size, periodic=False):
+        self.every = max(1, config.get('every', 100))
+        self.flush_every = config.get('flush_every', 10000)
+        self.path = config.get('path', 'observables.jsonl')
+        self.rdf_max = config.get('rdf_max', 12.0)
+        self.rdf_bins = config.get('rdf_bins', 100)
+        self.rdf_samples = config.get('rdf_samples', 2000)
+
+        self.box_size = box_size
+        self.image_box = box_size if periodic else None
+        self.volume = math.prod(box_size)
+        device = particles.positions.device
+
+        self.previous = particles.positions.clone()
+        self.displacement = torch.zeros_like(particles.positions)
+        self.msd = []
+        self.msd_steps = []
+        self.rdf_histogram = torch.zeros(self.rdf_bins, device=device, dtype=torch.float64)
+        self.rdf_norm = 0.0
+        self._reset_sums(particles.positions.shape[:-2], device)
+        self.flushed = 0
+
+    def rebase(self, particles):
+        # Positions moved outside dynamics (minimization) are not diffusion, so displacement restarts from here
+        self.previous.copy_(particles.positions)
+        self.displacement.zero_()
+    
+    def _reset_sums(self, shape, device):
+        names = ('potential', 'kinetic', 'total', 'temperature', 'pressure')
+        self.sums = {name: torch.zeros(shape, device=device, dtype=torch.float64) for name in names}
+        self.squares = {name: torch.zeros(shape, device=device, dtype=torch.float64) for name in names}
+        self.samples = 0
+        self.first_step = None
+        self.last_step = None
+
+    def _accumulate(self, name, value):
+        value = value.double()
+        self.sums[name] += value
+        self.squares[name] += value * value
+
+    def _rdf(self, positions):
+        # Reference rows are subsampled past rdf_samples, which keeps g(r) unbiased at O(samples * N) cost
+        positions = positions.reshape(-1, positions.shape[-2], 3)
+        replicas, n = positions.shape[:2]
+        rows = torch.arange(n, device=positions.device)
+        if n > self.rdf_samples:
+            rows = torch.randperm(n, device=positions.device)[:self.rdf_samples]
+
+        bin_width = self.rdf_max / self.rdf_bins
+        for replica in positions:
+            for chunk in rows.split(max(1, (1 << 22) // n)):
+                distances = torch.linalg.norm(minimum_image(replica[chunk].unsqueeze(1) - replica, self.image_box), dim=-1)
+                distances[torch.arange(len(chunk), device=chunk.device), chunk] = float('inf')
+                bins = (distances[distances < self.rdf_max] / bin_width).long()
+                self.rdf_histogram += torch.bincount(bins, minlength=self.rdf_bins).double()
+
+        self.rdf_norm += replicas * len(rows) * (n - 1) / self.volume
+
+    def sample(self, particles, tally, step):
+        kinetic_j = particles.kinetic_energy()
+        kinetic = kinetic_j / KCAL_PER_MOL_J
+        temperature = particles.temperature()
+        self._accumulate('kinetic', kinetic)
+        self._accumulate('temperature', temperature)
+
+        if tally.ready():
+            potential = tally.potential()
+            # P V = N k_B T + W / 3 with the pair virial W = sum r_ij . f_ij, both in kcal/mol
+            pressure = (2.0 * kinetic + tally.virial()) / (3.0 * self.volume) * BAR_PER_KCAL_MOL_A3
+            self._accumulate('potential', potential)
+            self._accumulate('total', potential + kinetic)
+            self._accumulate('pressure', pressure)
+
+        # Unwrapped displacement from per-sample minimum-image steps, valid while atoms move < L/2 between samples
+        self.displacement += minimum_image(particles.positions - self.previous, self.image_box)
+        self.previous.copy_(particles.positions)
+        self.msd.append(torch.sum(self.displacement ** 2, dim=-1).mean(dim=-1))
+        self.msd_steps.append(step)
+
+        self._rdf(particles.positions)
+
+        self.samples += 1
+        self.first_step = step if self.first_step is None else self.first_step
+        self.last_step = step
+
+    def summary(self, dt):
+        samples = max(self.samples, 1)
+        averages = {}
+        for name in self.sums:
+            mean = self.sums[name] / samples
+            std = torch.sqrt(torch.clamp(self.squares[name] / samples - mean * mean, min=0.0))
+            averages[name] = {'mean': mean.tolist(), 'std': std.tolist()}
+
+        shells = torch.arange(self.rdf_bins + 1, device=self.rdf_histogram.device, dtype=torch.float64)
+        shells = shells * (self.rdf_max / self.rdf_bins)
+        shell_volume = (4.0 / 3.0) * math.pi * (shells[1:] ** 3 - shells[:-1] ** 3)
+        g = self.rdf_histogram / (max(self.rdf_norm, 1e-12) * shell_volume)
+
+        msd = torch.stack(self.msd) if self.msd else torch.zeros(0)
+        diffusion = None
+        if len(self.msd_steps) > 1:
+            # Einstein relation over the window: MSD = 6 D t, D in A^2/fs
+            elapsed = (self.msd_steps[-1] - self.msd_steps[0]) * dt
+            diffusion = ((msd[-1] - msd[0]) / (6.0 * max(elapsed, 1e-12))).tolist()
+
+        return {
+            'steps': [self.first_step, self.last_step],
+            'samples': self.samples,
+            'averages': averages,
+            'rdf': {'r_max': self.rdf_max, 'g': [round(v, 4) for v in g.tolist()]},
+            'msd': {'steps': self.msd_steps, 'values': msd.tolist()},
+            'diffusion': diffusion,
+        }
+
+    def flush(self, dt):
+        if self.samples == 0:
+            return None
+        summary = self.summary(dt)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(summary) + "\n")
+
+        self.flushed += 1
+        self._reset_sums(self.sums['kinetic'].shape, self.rdf_histogram.device)
+        self.rdf_histogram.zero_()
+        self.rdf_norm = 0.0
+        self.msd = []
+        self.msd_steps = []
+        return summary
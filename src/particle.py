@@ -1,5 +1,35 @@
 import torch
-from dataclasses import dataclass
+from collections.abc import Sequence
+from dataclasses import dataclass, replace
+
+class ElementView(Sequence):
+    def __init__(self, particles):
+        self._particles = particles
+        self._key = None
+        self._symbols = None
+    
+    def _materialize(self):
+        species_id = self._particles.species_id
+        if self._key is not species_id:
+            symbols = self._particles.symbols
+            self._symbols = [symbols[i] for i in species_id.tolist()]
+            self._key = species_id
+        return self._symbols
+    
+    def __len__(self):
+        return len(self._particles.species_id)
+    
+    def __getitem__(self, index):
+        return self._materialize()[index]
+    
+    def __iter__(self):
+        return iter(self._materialize())
+    
+    def __eq__(self, other):
+        return list(self) == list(other)
+    
+    def __repr__(self):
+        return repr(self._materialize())
 
 @dataclass
 class ParticleSystem:
@@ -13,15 +43,58 @@ class ParticleSystem:
     sigmas: torch.Tensor
     elements: list
     device: str
+    forces: torch.Tensor = None
+    slow_forces: torch.Tensor = None
+    species_id: torch.Tensor = None
+    pair_table: torch.Tensor = None
+    symbols: list = None
+
+    def __post_init__(self):
+        if self.species_id is None:
+            self.symbols = list(dict.fromkeys(self.elements))
+            lookup = {symbol: i for i, symbol in enumerate(self.symbols)}
+            self.species_id = torch.tensor([lookup[e] for e in self.elements], dtype=torch.long,
+                                           device=self.positions.device)
+        elif self.symbols is None:
+            self.symbols = [str(i) for i in range(int(self.species_id.max()) + 1)]
+        
+        self.elements = ElementView(self)
+        self._composition_key = None
+        self._composition = None
 
     @property
     def n_particles(self):
-        return len(self.positions)
+        return self.positions.shape[-2]
+
+    @property
+    def n_replicas(self):
+        return self.positions.shape[0] if self.batched else 1
+
+    @property
+    def batched(self):
+        return self.positions.dim() == 3
+
+    def replica(self, index):
+        forces = None if self.forces is None else self.forces[index]
+        slow_forces = None if self.slow_forces is None else self.slow_forces[index]
+        return replace(self, positions=self.positions[index], velocities=self.velocities[index], forces=forces,
+                       slow_forces=slow_forces)
+
+    def invalidate_forces(self):
+        self.forces = None
+        self.slow_forces = None
+
+    def composition(self):
+        if self._composition_key is not self.species_id:
+            counts = torch.bincount(self.species_id, minlength=len(self.symbols)).tolist()
+            self._composition = {s: c for s, c in zip(self.symbols, counts) if c > 0}
+            self._composition_key = self.species_id
+        return dict(self._composition)
 
     def kinetic_energy(self):
         mass_kg = self.masses * 1.66053906660e-27
         v_m_s = self.velocities * 1e5
-        return 0.5 * torch.sum(mass_kg[:, None] * v_m_s ** 2)
+        return 0.5 * torch.sum(mass_kg.unsqueeze(-1) * v_m_s ** 2, dim=(-2, -1))
 
     def temperature(self, k_b=1.380649e-23):
         ke = self.kinetic_energy()
@@ -29,6 +102,6 @@ class ParticleSystem:
 
     def apply_thermostat(self, target_temp, tau, dt, k_b=1.380649e-23):
         current_temp = self.temperature(k_b)
-        if current_temp > 0:
-            lambda_factor = torch.sqrt(1.0 + (dt / tau) * (target_temp / current_temp - 1.0))
-            self.velocities *= lambda_factor
+        lambda_factor = torch.sqrt(1.0 + (dt / tau) * (target_temp / current_temp - 1.0))
+        lambda_factor = torch.where(current_temp > 0, lambda_factor, torch.ones_like(lambda_factor))
+        self.velocities *= lambda_factor.reshape(lambda_factor.shape + (1, 1))
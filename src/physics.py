@@ -1,59 +1,295 @@
+import math
 import torch
+from functools import partial
 
-def find_k_nearest(positions, k):
+_CHUNK_ELEMENTS = 1 << 22
+
+def _stencil(dims, periodic):
+    # With periodic wrapping, offsets -1 and +1 hit the same cell when an axis has fewer than 3 cells
+    axes = [[0] if periodic and d == 1 else [0, 1] if periodic and d == 2 else [-1, 0, 1] for d in dims]
+    return [(dx, dy, dz) for dx in axes[0] for dy in axes[1] for dz in axes[2]]
+
+def minimum_image(diff, box_size):
+    if box_size is None:
+        return diff
+    box = box_size if torch.is_tensor(box_size) else torch.tensor(box_size, device=diff.device, dtype=diff.dtype)
+    return diff - box * torch.round(diff / box)
+
+def gather_neighbors(values, indices):
+    if indices.dim() == 2:
+        return values[indices]
+    batch = torch.arange(len(indices), device=indices.device).view(-1, 1, 1)
+    return values[batch, indices]
+
+def find_k_nearest(positions, k, box_size=None):
+    n = positions.shape[-2]
+    if box_size is None:
+        distances = torch.cdist(positions, positions)
+    else:
+        distances = torch.norm(minimum_image(positions.unsqueeze(-2) - positions.unsqueeze(-3), box_size), dim=-1)
+    knn_distances, knn_indices = torch.topk(distances, min(k + 1, n), largest=False, dim=-1)
+    return knn_distances[..., 1:], knn_indices[..., 1:]
+
+def find_k_nearest_cells(positions, k, box_size, cell_size=None, periodic=False):
+    if positions.dim() == 3:
+        results = [find_k_nearest_cells(replica, k, box_size, cell_size, periodic) for replica in positions]
+        return torch.stack([d for d, _ in results]), torch.stack([i for _, i in results])
+    
     n = len(positions)
-    distances = torch.cdist(positions, positions)
-    knn_distances, knn_indices = torch.topk(distances, min(k + 1, n), largest=False, dim=1)
-    return knn_distances[:, 1:], knn_indices[:, 1:]
+    k = min(k, n - 1)
+    image_box = box_size if periodic else None
+    if k < 1:
+        return find_k_nearest(positions, k, image_box)
+    
+    device = positions.device
+    
+    # Default cells hold ~k/2 particles, so the 27-cell stencil almost always contains the k nearest
+    if cell_size is None:
+        volume = box_size[0] * box_size[1] * box_size[2]
+        cell_size = (volume * max(k / 2.0, 1.0) / n) ** (1.0 / 3.0)
+    
+    dims = [max(1, int(s // cell_size)) for s in box_size]
+    edges = [s / d for s, d in zip(box_size, dims)]
+    dims_t = torch.tensor(dims, device=device)
+    edges_t = torch.tensor(edges, device=device, dtype=positions.dtype)
+    
+    coords = torch.floor(positions / edges_t).long()
+    if periodic:
+        coords = torch.remainder(coords, dims_t)
+    else:
+        coords = torch.minimum(torch.clamp(coords, min=0), dims_t - 1)
+    cell_ids = (coords[:, 0] * dims[1] + coords[:, 1]) * dims[2] + coords[:, 2]
+    
+    order = torch.argsort(cell_ids)
+    counts = torch.bincount(cell_ids, minlength=dims[0] * dims[1] * dims[2])
+    starts = torch.cumsum(counts, 0) - counts
+    max_count = int(counts.max())
+    
+    stencil = torch.tensor(_stencil(dims, periodic), device=device)
+    slots = torch.arange(max_count, device=device)
+    chunk = max(1, _CHUNK_ELEMENTS // (len(stencil) * max_count))
+    
+    knn_distances = torch.empty(n, k, device=device, dtype=positions.dtype)
+    knn_indices = torch.empty(n, k, device=device, dtype=torch.long)
+    
+    for start in range(0, n, chunk):
+        rows = torch.arange(start, min(start + chunk, n), device=device)
+        m = len(rows)
+        
+        nbr = coords[rows].unsqueeze(1) + stencil
+        if periodic:
+            inside = torch.ones(nbr.shape[:2], dtype=torch.bool, device=device)
+            nbr = torch.remainder(nbr, dims_t)
+        else:
+            inside = torch.all((nbr >= 0) & (nbr < dims_t), dim=2)
+            nbr = torch.minimum(torch.clamp(nbr, min=0), dims_t - 1)
+        nbr_ids = (nbr[..., 0] * dims[1] + nbr[..., 1]) * dims[2] + nbr[..., 2]
+        
+        valid = inside.unsqueeze(2) & (slots < counts[nbr_ids].unsqueeze(2))
+        sorted_slots = torch.clamp(starts[nbr_ids].unsqueeze(2) + slots, max=n - 1)
+        candidates = order[sorted_slots].reshape(m, -1)
+        valid = valid.reshape(m, -1) & (candidates != rows.unsqueeze(1))
+        
+        distances = torch.norm(minimum_image(positions[candidates] - positions[rows].unsqueeze(1), image_box), dim=2)
+        distances = distances.masked_fill(~valid, float('inf'))
+        
+        if distances.shape[1] < k:
+            pad = k - distances.shape[1]
+            distances = torch.cat([distances, distances.new_full((m, pad), float('inf'))], dim=1)
+            candidates = torch.cat([candidates, candidates.new_zeros((m, pad))], dim=1)
+        
+        chunk_distances, chunk_slots = torch.topk(distances, k, largest=False, dim=1)
+        knn_distances[rows] = chunk_distances
+        knn_indices[rows] = torch.gather(candidates, 1, chunk_slots)
+    
+    # Anything within one cell edge lies inside the stencil; rows whose k-th neighbor is farther fall back to brute force
+    missed = torch.nonzero(knn_distances[:, -1] > min(edges)).squeeze(1)
+    if len(missed) > 0:
+        distances = torch.norm(minimum_image(positions[missed].unsqueeze(1) - positions, image_box), dim=2)
+        distances[torch.arange(len(missed), device=device), missed] = float('inf')
+        knn_distances[missed], knn_indices[missed] = torch.topk(distances, k, largest=False, dim=1)
+    
+    return knn_distances, knn_indices
+
+def find_pairs(indices):
+    # Replicas are flattened so that pair indices address positions.reshape(-1, 3)
+    n, k = indices.shape[-2:]
+    indices = indices.reshape(-1, n, k)
+    offsets = torch.arange(len(indices), device=indices.device).view(-1, 1, 1) * n
+    i = (torch.arange(n, device=indices.device).view(1, n, 1) + offsets).expand_as(indices).reshape(-1)
+    j = (indices + offsets).reshape(-1)
+    total = len(indices) * n
+    keys = torch.unique(torch.minimum(i, j) * total + torch.maximum(i, j))
+    return keys // total, keys % total
+
+def build_pair_table(epsilons, sigmas, charges):
+    epsilon_ij = torch.sqrt(epsilons.unsqueeze(1) * epsilons.unsqueeze(0))
+    sigma_ij = 0.5 * (sigmas.unsqueeze(1) + sigmas.unsqueeze(0))
+    sigma6 = sigma_ij ** 6
+    qq = charges.unsqueeze(1) * charges.unsqueeze(0)
+    return torch.stack([epsilon_ij, sigma6, sigma6 ** 2, qq], dim=-1)
 
-def compute_forces(particles, k, coulomb_k):
+def pair_parameters(particles, i, j):
+    if particles.pair_table is None:
+        epsilon_ij = torch.sqrt(particles.epsilons[i] * particles.epsilons[j])
+        sigma6 = (0.5 * (particles.sigmas[i] + particles.sigmas[j])) ** 6
+        qq = particles.charges[i] * particles.charges[j]
+        return epsilon_ij, sigma6, sigma6 ** 2, qq
+    
+    params = particles.pair_table[particles.species_id[i], particles.species_id[j]]
+    return params.unbind(-1)
+
+def force_kernel(pos_diff, epsilon_ij, sigma6, sigma12, qq, coulomb_k, ewald_alpha=None, reduce=False, dtype=None,
+                 lj=True, coulomb=True):
+    if dtype is not None:
+        pos_diff = pos_diff.to(dtype)
+        epsilon_ij, sigma6, sigma12, qq = epsilon_ij.to(dtype), sigma6.to(dtype), sigma12.to(dtype), qq.to(dtype)
+    
+    # Works on r^2 so the LJ term needs no sqrt; clamping r^2 at 1e-4 matches clamping r at 1e-2
+    r2 = torch.clamp(torch.sum(pos_diff * pos_diff, dim=-1), min=1e-4)
+    inv_r2 = 1.0 / r2
+    inv_r = torch.sqrt(inv_r2)
+    inv_r6 = inv_r2 * inv_r2 * inv_r2
+    
+    f_over_r = torch.zeros_like(r2)
+    if lj:
+        f_over_r = f_over_r + 24.0 * epsilon_ij * inv_r6 * (2.0 * sigma12 * inv_r6 - sigma6) * inv_r2
+    
+    if coulomb:
+        f_coulomb_over_r = coulomb_k * qq * inv_r2 * inv_r
+        if ewald_alpha is not None:
+            r = r2 * inv_r
+            screening = torch.erfc(ewald_alpha * r) + (2.0 * ewald_alpha / math.sqrt(math.pi)) * r * torch.exp(-(ewald_alpha * r) ** 2)
+            f_coulomb_over_r = f_coulomb_over_r * screening
+        f_over_r = f_over_r + f_coulomb_over_r
+    
+    force_vectors = f_over_r.unsqueeze(-1) * pos_diff
+    if reduce:
+        return torch.sum(force_vectors, dim=-2)
+    return force_vectors
+
+def pair_energy(pos_diff, epsilon_ij, sigma6, sigma12, qq, coulomb_k, ewald_alpha=None, lj=True, coulomb=True):
+    r2 = torch.clamp(torch.sum(pos_diff * pos_diff, dim=-1), min=1e-4)
+    inv_r6 = 1.0 / (r2 * r2 * r2)
+    
+    energy = torch.zeros_like(r2)
+    if lj:
+        energy = energy + 4.0 * epsilon_ij * inv_r6 * (sigma12 * inv_r6 - sigma6)
+    
+    if coulomb:
+        r = torch.sqrt(r2)
+        e_coulomb = coulomb_k * qq / r
+        if ewald_alpha is not None:
+            e_coulomb = e_coulomb * torch.erfc(ewald_alpha * r)
+        energy = energy + e_coulomb
+    return energy
+
+def _term(lj, coulomb):
+    return 'all' if lj and coulomb else ('lj' if lj else 'coulomb')
+
+def make_force_kernel(backend='eager', precision='float32'):
+    kernel = force_kernel
+    if backend == 'compiled':
+        kernel = torch.compile(force_kernel, dynamic=True)
+    return partial(kernel, dtype=getattr(torch, precision))
+
+def compute_pair_forces(particles, k, coulomb_k, neighbor_fn=find_k_nearest, ewald_alpha=None, kernel=force_kernel,
+                        lj=True, coulomb=True, box_size=None, tally=None):
     n = particles.n_particles
     k = min(k, n - 1)
     
-    distances, indices = find_k_nearest(particles.positions, k)
+    _, indices = neighbor_fn(particles.positions, k)
+    i, j = find_pairs(indices)
     
-    pos_i = particles.positions.unsqueeze(1)
-    pos_j = particles.positions[indices]
-    pos_diff = pos_i - pos_j
+    positions = particles.positions.reshape(-1, 3)
+    pos_diff = minimum_image(positions[i] - positions[j], box_size)
     
-    r_vec = torch.norm(pos_diff, dim=2, keepdim=True)
-    r_vec = torch.clamp(r_vec, min=1e-2)
-    direction = pos_diff / r_vec
+    params = pair_parameters(particles, i % n, j % n)
+    force_vectors = kernel(pos_diff, *params, coulomb_k, ewald_alpha, lj=lj, coulomb=coulomb)
     
-    r = r_vec.squeeze(-1)
+    forces = torch.zeros(positions.shape, device=positions.device, dtype=force_vectors.dtype)
+    forces.index_add_(0, i, force_vectors)
+    forces.index_add_(0, j, -force_vectors)
     
-    epsilon_i = particles.epsilons.unsqueeze(1)
-    epsilon_j = particles.epsilons[indices]
-    epsilon_ij = torch.sqrt(epsilon_i * epsilon_j)
+    if tally is not None:
+        replica = i // n
+        energy = torch.zeros(particles.n_replicas, device=positions.device, dtype=pos_diff.dtype)
+        virial = torch.zeros_like(energy)
+        energy.index_add_(0, replica, pair_energy(pos_diff, *params, coulomb_k, ewald_alpha, lj, coulomb))
+        virial.index_add_(0, replica, torch.sum(force_vectors.to(pos_diff.dtype) * pos_diff, dim=-1))
+        batch_shape = particles.positions.shape[:-2]
+        tally.record(_term(lj, coulomb), energy.reshape(batch_shape), virial.reshape(batch_shape))
     
-    sigma_i = particles.sigmas.unsqueeze(1)
-    sigma_j = particles.sigmas[indices]
-    sigma_ij = 0.5 * (sigma_i + sigma_j)
+    return forces.reshape(particles.positions.shape).to(particles.positions.dtype)
+
+def compute_knn_forces(particles, k, coulomb_k, neighbor_fn=find_k_nearest, ewald_alpha=None, kernel=force_kernel,
+                       lj=True, coulomb=True, box_size=None, tally=None):
+    n = particles.n_particles
+    k = min(k, n - 1)
     
-    sigma_r6 = (sigma_ij / r) ** 6
-    sigma_r12 = sigma_r6 ** 2
-    f_lj_mag = 24.0 * epsilon_ij * (2.0 * sigma_r12 - sigma_r6) / r
+    distances, indices = neighbor_fn(particles.positions, k)
     
-    q_i = particles.charges.unsqueeze(1)
-    q_j = particles.charges[indices]
-    f_coulomb_mag = coulomb_k * q_i * q_j / (r ** 2)
+    pos_i = particles.positions.unsqueeze(-2)
+    pos_j = gather_neighbors(particles.positions, indices)
+    pos_diff = minimum_image(pos_i - pos_j, box_size)
     
-    f_total_mag = f_lj_mag + f_coulomb_mag
+    i = torch.arange(n, device=indices.device).unsqueeze(1)
+    params = pair_parameters(particles, i, indices)
+    if tally is None:
+        forces = kernel(pos_diff, *params, coulomb_k, ewald_alpha, reduce=True, lj=lj, coulomb=coulomb)
+        return forces.to(particles.positions.dtype)
+    
+    # Each kNN interaction is shared by two atoms, so half of its energy and virial is charged to atom i
+    force_vectors = kernel(pos_diff, *params, coulomb_k, ewald_alpha, lj=lj, coulomb=coulomb)
+    energy = 0.5 * pair_energy(pos_diff, *params, coulomb_k, ewald_alpha, lj, coulomb).sum(dim=(-2, -1))
+    virial = 0.5 * torch.sum(force_vectors.to(pos_diff.dtype) * pos_diff, dim=(-3, -2, -1))
+    tally.record(_term(lj, coulomb), energy, virial)
+    
+    return force_vectors.sum(dim=-2).to(particles.positions.dtype)
+
+def compute_forces(particles, k, coulomb_k, neighbor_fn=find_k_nearest, pairwise=False, long_range=None,
+                   kernel=force_kernel, terms='all', box_size=None, tally=None):
+    # terms selects a force group: 'lj' or 'coulomb' split by interaction, while 'short' (every pair term, with
+    # real-space Coulomb under PME) and 'long' (the PME reciprocal mesh alone) split by range for RESPA
+    ewald_alpha = None if long_range is None else long_range.alpha
+    lj = terms in ('all', 'lj', 'short')
+    coulomb = terms in ('all', 'coulomb', 'short')
+    mesh = long_range is not None and terms in ('all', 'coulomb', 'long')
     
-    force_vectors = f_total_mag.unsqueeze(-1) * direction
-    forces = torch.sum(force_vectors, dim=1)
+    if terms == 'long':
+        forces = torch.zeros_like(particles.positions)
+    elif pairwise:
+        forces = compute_pair_forces(particles, k, coulomb_k, neighbor_fn, ewald_alpha, kernel, lj, coulomb, box_size,
+                                     tally)
+    else:
+        forces = compute_knn_forces(particles, k, coulomb_k, neighbor_fn, ewald_alpha, kernel, lj, coulomb, box_size,
+                                    tally)
+    
+    if mesh:
+        if tally is None:
+            forces = forces + long_range(particles.positions, particles.charges, coulomb_k)
+        else:
+            mesh_forces, energy, virial = long_range(particles.positions, particles.charges, coulomb_k, energy=True)
+            forces = forces + mesh_forces
+            tally.record('pme', energy, virial)
     
     return forces
 
-def apply_boundary(particles, boundary_size, restitution):
+def confine(positions, velocities, boundary_tensor, restitution, periodic=False):
+    # Device-only: no host synchronization, so it can run inside captured CUDA graphs
+    if periodic:
+        positions.copy_(torch.remainder(positions, boundary_tensor))
+        return None
+    
+    hit = (positions < 0) | (positions > boundary_tensor)
+    positions.copy_(torch.minimum(torch.clamp(positions, min=0), boundary_tensor))
+    velocities.mul_(1.0 - (1.0 + restitution) * hit.to(velocities.dtype))
+    return hit
+
+def apply_boundary(particles, boundary_size, restitution, periodic=False):
     boundary_tensor = torch.tensor(boundary_size, device=particles.positions.device, dtype=particles.positions.dtype)
     
-    for dim in range(3):
-        lower = particles.positions[:, dim] < 0
-        upper = particles.positions[:, dim] > boundary_tensor[dim]
-        
-        particles.positions[lower, dim] = 0
-        particles.velocities[lower, dim] *= -restitution
-        
-        particles.positions[upper, dim] = boundary_tensor[dim]
-        particles.velocities[upper, dim] *= -restitution
+    # Forces use minimum-image vectors, so wrapping leaves cached forces valid
+    hit = confine(particles.positions, particles.velocities, boundary_tensor, restitution, periodic)
+    if hit is not None and torch.any(hit):
+        particles.invalidate_forces()
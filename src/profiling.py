@@ -0,0 +1,123 @@
+import time
+import torch
+from contextlib import contextmanager
+
+PHASES = ('neighbor_search', 'forces', 'integration', 'boundary', 'thermostat', 'element_counting', 'render')
+PHASE_LABELS = {
+    'neighbor_search': 'nbr',
+    'forces': 'frc',
+    'integration': 'int',
+    'boundary': 'bnd',
+    'thermostat': 'thm',
+    'element_counting': 'cnt',
+    'render': 'rnd',
+}
+
+def format_phases(phases):
+    return ' '.join(f"{PHASE_LABELS[name]} {phases[name]:.2f}" for name in PHASES if phases.get(name)) + " ms"
+
+class PhaseTimer:
+    def __init__(self, device='cpu', synchronize=False):
+        # Without synchronize the timers only see host-side launch cost on asynchronous devices
+        self.device = device
+        self.synchronize = synchronize
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.steps = 0
+        self._stack = []
+
+    def _sync(self):
+        if not self.synchronize:
+            return
+        if self.device == 'cuda':
+            torch.cuda.synchronize()
+        elif self.device == 'mps':
+            torch.mps.synchronize()
+
+    @contextmanager
+    def phase(self, name):
+        # Times are exclusive: a nested phase (neighbor search inside integration) is charged only to itself
+        self._sync()
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            if self.synchronize:
+                with torch.profiler.record_function(name):
+                    yield
+            else:
+                yield
+        finally:
+            self._sync()
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            self.totals[name] += elapsed - nested
+            self.counts[name] += 1
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+        timed.__wrapped__ = fn
+        return timed
+
+    def reset(self):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.steps = 0
+
+    def per_step(self):
+        steps = max(self.steps, 1)
+        return {name: 1e3 * total / steps for name, total in self.totals.items()}
+
+    def stats(self):
+        total = sum(self.totals.values())
+        return {
+            'steps': self.steps,
+            'synchronized': self.synchronize,
+            'phases': {
+                name: {
+                    'total_s': self.totals[name],
+                    'calls': self.counts[name],
+                    'ms_per_step': 1e3 * self.totals[name] / max(self.steps, 1),
+                    'fraction': self.totals[name] / total if total > 0 else 0.0,
+                }
+                for name in PHASES
+            },
+        }
+
+    def summary(self):
+        stats = self.stats()
+        lines = [f"{'phase':18s} {'total (s)':>10s} {'ms/step':>10s} {'share':>7s}"]
+        for name, phase in stats['phases'].items():
+            lines.append(f"{name:18s} {phase['total_s']:10.3f} {phase['ms_per_step']:10.3f} "
+                         f"{100 * phase['fraction']:6.1f}%")
+        return "\n".join(lines)
+
+class TraceWindow:
+    def __init__(self, start, stop, path, device='cpu'):
+        self.start = start
+        self.stop = stop
+        self.path = path
+        self.device = device
+        self.profiler = None
+
+    def update(self, step):
+        if self.profiler is None and self.start <= step < self.stop:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device == 'cuda':
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(activities=activities)
+            self.profiler.__enter__()
+        elif self.profiler is not None and step >= self.stop:
+            self.close()
+
+    def close(self):
+        if self.profiler is None:
+            return
+        self.profiler.__exit__(None, None, None)
+        self.profiler.export_chrome_trace(self.path)
+        print(f"Profiler trace for steps {self.start}..{self.stop} written to {self.path}")
+        self.profiler = None
+        self.start = self.stop
@@ -1,7 +1,56 @@
 import glfw
 import numpy as np
+import torch
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileShader
+from src.profiling import format_phases
+
+COLOR_MODES = {"element": 0, "velocity": 1, "mass": 2, "charge": 3}
+
+def pack_static(particles):
+    # Per-particle attributes that only change when the particle set does; colors are mapped in the vertex shader
+    arrays = {name: np.ascontiguousarray(getattr(particles, name).detach().cpu().numpy(), dtype='f4')
+              for name in ('colors', 'masses', 'charges')}
+    masses = arrays['masses']
+    mass_range = (float(masses.min()), float(masses.max())) if len(masses) else (0.0, 1.0)
+    return arrays, mass_range
+
+def pack_frame(particles):
+    positions = np.ascontiguousarray(particles.positions.detach().cpu().numpy(), dtype='f4')
+    speed = np.ascontiguousarray(torch.linalg.norm(particles.velocities, dim=-1).detach().cpu().numpy(), dtype='f4')
+    return positions, speed
+
+def camera_mvp(camera, window_size):
+    # Column-major (transposed) for glUniformMatrix4fv with transpose=GL_FALSE
+    cam = np.array(camera['position'], dtype=np.float32)
+    look = np.array(camera['look_at'], dtype=np.float32)
+    up = np.array([0, 1, 0], dtype=np.float32)
+    
+    aspect = window_size[0] / window_size[1]
+    f = 1.0 / np.tan(np.radians(45.0) / 2.0)
+    near, far = 10.0, 300.0
+    
+    projection = np.array([
+        [f/aspect, 0, 0, 0],
+        [0, f, 0, 0],
+        [0, 0, -(far+near)/(far-near), -(2*far*near)/(far-near)],
+        [0, 0, -1, 0]
+    ], dtype=np.float32)
+    
+    z = cam - look
+    z = z / np.linalg.norm(z)
+    x = np.cross(up, z)
+    x = x / np.linalg.norm(x)
+    y = np.cross(z, x)
+    
+    view = np.array([
+        [x[0], x[1], x[2], -np.dot(x, cam)],
+        [y[0], y[1], y[2], -np.dot(y, cam)],
+        [z[0], z[1], z[2], -np.dot(z, cam)],
+        [0, 0, 0, 1]
+    ], dtype=np.float32)
+    
+    return np.ascontiguousarray(np.dot(projection, view).T)
 
 class Renderer:
     def __init__(self, config):
@@ -35,13 +84,29 @@ class Renderer:
             #version 330 core
             layout (location = 0) in vec3 in_position;
             layout (location = 1) in vec3 in_color;
+            layout (location = 2) in float in_speed;
+            layout (location = 3) in float in_mass;
+            layout (location = 4) in float in_charge;
             uniform mat4 mvp;
             uniform float point_size;
+            uniform int color_mode;
+            uniform float speed_max;
+            uniform vec2 mass_range;
             out vec3 v_color;
             void main() {
                 gl_Position = mvp * vec4(in_position, 1.0);
                 gl_PointSize = point_size;
-                v_color = in_color;
+                if (color_mode == 1) {
+                    float t = in_speed / speed_max;
+                    v_color = vec3(t, 1.0 - t, 0.5);
+                } else if (color_mode == 2) {
+                    float t = (in_mass - mass_range.x) / (mass_range.y - mass_range.x + 1e-8);
+                    v_color = vec3(t, 0.5, 1.0 - t);
+                } else if (color_mode == 3) {
+                    v_color = in_charge > 0.0 ? vec3(1.0, 0.0, 0.0) : (in_charge < 0.0 ? vec3(0.0, 0.0, 1.0) : vec3(0.5));
+                } else {
+                    v_color = in_color;
+                }
             }
         """, GL_VERTEX_SHADER)
         
@@ -64,20 +129,30 @@ class Renderer:
         self.vao = glGenVertexArrays(1)
         self.vbo_pos = glGenBuffers(1)
         self.vbo_col = glGenBuffers(1)
+        self.vbo_speed = glGenBuffers(1)
+        self.vbo_mass = glGenBuffers(1)
+        self.vbo_charge = glGenBuffers(1)
         
         glBindVertexArray(self.vao)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo_pos)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
-        glEnableVertexAttribArray(0)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo_col)
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 0, None)
-        glEnableVertexAttribArray(1)
+        for location, vbo, size in [(0, self.vbo_pos, 3), (1, self.vbo_col, 3), (2, self.vbo_speed, 1),
+                                    (3, self.vbo_mass, 1), (4, self.vbo_charge, 1)]:
+            glBindBuffer(GL_ARRAY_BUFFER, vbo)
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, 0, None)
+            glEnableVertexAttribArray(location)
         glBindVertexArray(0)
         
         self.paused = False
         self.running = True
         self.mvp_loc = glGetUniformLocation(self.shader, "mvp")
         self.point_size_loc = glGetUniformLocation(self.shader, "point_size")
+        self.color_mode_loc = glGetUniformLocation(self.shader, "color_mode")
+        self.speed_max_loc = glGetUniformLocation(self.shader, "speed_max")
+        self.mass_range_loc = glGetUniformLocation(self.shader, "mass_range")
+        
+        self.capacity = 0
+        self.static_key = None
+        self.mass_range = (0.0, 1.0)
+        self._mvp = None
     
     def _key_callback(self, window, key, scancode, action, mods):
         if action == glfw.PRESS:
@@ -90,88 +165,78 @@ class Renderer:
                 idx = modes.index(self.color_mode) if self.color_mode in modes else 0
                 self.color_mode = modes[(idx + 1) % len(modes)]
     
-    def _compute_colors(self, particles):
-        if self.color_mode == "element":
-            return particles.colors.cpu().numpy()
-        elif self.color_mode == "velocity":
-            v = particles.velocities.cpu().numpy()
-            v_mag = np.linalg.norm(v, axis=1)
-            v_max = v_mag.max() + 1e-8
-            v_norm = v_mag / v_max
-            return np.stack([v_norm, 1 - v_norm, 0.5 * np.ones_like(v_norm)], axis=1)
-        elif self.color_mode == "mass":
-            m = particles.masses.cpu().numpy()
-            m_norm = (m - m.min()) / (m.max() - m.min() + 1e-8)
-            return np.stack([m_norm, 0.5 * np.ones_like(m_norm), 1 - m_norm], axis=1)
-        elif self.color_mode == "charge":
-            q = particles.charges.cpu().numpy()
-            colors = np.zeros((len(q), 3))
-            colors[q > 0] = [1, 0, 0]
-            colors[q < 0] = [0, 0, 1]
-            colors[q == 0] = [0.5, 0.5, 0.5]
-            return colors
-        return particles.colors.cpu().numpy()
+    def _allocate(self, n):
+        for vbo, size in [(self.vbo_pos, 3), (self.vbo_col, 3), (self.vbo_speed, 1),
+                          (self.vbo_mass, 1), (self.vbo_charge, 1)]:
+            glBindBuffer(GL_ARRAY_BUFFER, vbo)
+            glBufferData(GL_ARRAY_BUFFER, n * size * 4, None, GL_DYNAMIC_DRAW)
+        self.capacity = n
+        self.static_key = None
     
-    def _create_mvp(self):
-        cam = np.array(self.config['camera']['position'], dtype=np.float32)
-        look = np.array(self.config['camera']['look_at'], dtype=np.float32)
-        up = np.array([0, 1, 0], dtype=np.float32)
-        
-        aspect = self.window_size[0] / self.window_size[1]
-        f = 1.0 / np.tan(np.radians(45.0) / 2.0)
-        near, far = 10.0, 300.0
-        
-        projection = np.array([
-            [f/aspect, 0, 0, 0],
-            [0, f, 0, 0],
-            [0, 0, -(far+near)/(far-near), -(2*far*near)/(far-near)],
-            [0, 0, -1, 0]
-        ], dtype=np.float32)
-        
-        z = cam - look
-        z = z / np.linalg.norm(z)
-        x = np.cross(up, z)
-        x = x / np.linalg.norm(x)
-        y = np.cross(z, x)
-        
-        view = np.array([
-            [x[0], x[1], x[2], -np.dot(x, cam)],
-            [y[0], y[1], y[2], -np.dot(y, cam)],
-            [z[0], z[1], z[2], -np.dot(z, cam)],
-            [0, 0, 0, 1]
-        ], dtype=np.float32)
-        
-        return np.dot(projection, view)
+    def _upload(self, vbo, array):
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, array.nbytes, array)
     
-    def render(self, particles, fps, element_counts, integrator='Euler'):
+    def static_stale(self, particles):
+        # Static buffers are re-uploaded only when the particle set hands over different tensors
+        key = (particles.colors, particles.masses, particles.charges)
+        if self.static_key is not None and all(a is b for a, b in zip(key, self.static_key)):
+            return False
+        self.static_key = key
+        return True
+    
+    def _upload_static(self, particles):
+        arrays, self.mass_range = pack_static(particles)
+        self._upload(self.vbo_col, arrays['colors'])
+        self._upload(self.vbo_mass, arrays['masses'])
+        self._upload(self.vbo_charge, arrays['charges'])
+    
+    def set_camera(self, position, look_at):
+        self.config['camera']['position'] = list(position)
+        self.config['camera']['look_at'] = list(look_at)
+        self._mvp = None
+    
+    @property
+    def mvp(self):
+        if self._mvp is None:
+            self._mvp = camera_mvp(self.config['camera'], self.window_size)
+        return self._mvp
+    
+    def render(self, particles, fps, element_counts, integrator='Euler', phases=None):
         if glfw.window_should_close(self.window):
             self.running = False
             return
         
-        positions = particles.positions.cpu().numpy().astype('f4')
-        colors = self._compute_colors(particles).astype('f4')
+        n = len(particles.positions)
+        if n > self.capacity:
+            self._allocate(n)
+        
+        if self.static_stale(particles):
+            self._upload_static(particles)
+        
+        positions, speed = pack_frame(particles)
+        self._upload(self.vbo_pos, positions)
+        self._upload(self.vbo_speed, speed)
         
         glClearColor(self.bg[0], self.bg[1], self.bg[2], 1.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         
         glUseProgram(self.shader)
         
-        mvp = self._create_mvp()
-        glUniformMatrix4fv(self.mvp_loc, 1, GL_FALSE, mvp.T)
+        glUniformMatrix4fv(self.mvp_loc, 1, GL_FALSE, self.mvp)
         glUniform1f(self.point_size_loc, self.point_size)
-        
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo_pos)
-        glBufferData(GL_ARRAY_BUFFER, positions.nbytes, positions, GL_DYNAMIC_DRAW)
-        
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo_col)
-        glBufferData(GL_ARRAY_BUFFER, colors.nbytes, colors, GL_DYNAMIC_DRAW)
+        glUniform1i(self.color_mode_loc, COLOR_MODES.get(self.color_mode, 0))
+        glUniform1f(self.speed_max_loc, float(speed.max()) + 1e-8 if n else 1.0)
+        glUniform2f(self.mass_range_loc, *self.mass_range)
         
         glBindVertexArray(self.vao)
-        glDrawArrays(GL_POINTS, 0, len(positions))
+        glDrawArrays(GL_POINTS, 0, n)
         glBindVertexArray(0)
         
         elem_str = ' '.join([f"{k}:{v}" for k, v in element_counts.items()])
         title = f"AE | {fps:.0f} FPS | {integrator} | {elem_str}"
+        if phases:
+            title += f" | {format_phases(phases)}"
         glfw.set_window_title(self.window, title)
         
         glfw.swap_buffers(self.window)
@@ -179,7 +244,6 @@ class Renderer:
     
     def cleanup(self):
         glDeleteVertexArrays(1, [self.vao])
-        glDeleteBuffers(1, [self.vbo_pos])
-        glDeleteBuffers(1, [self.vbo_col])
+        glDeleteBuffers(5, [self.vbo_pos, self.vbo_col, self.vbo_speed, self.vbo_mass, self.vbo_charge])
         glDeleteProgram(self.shader)
         glfw.terminate()
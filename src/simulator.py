@@ -1,8 +1,16 @@
 import time
 import torch
-from src.integrator import euler_step, velocity_verlet_step
-from src.physics import apply_boundary
-from src.utils import get_element_counts
+from functools import partial
+from src.engine import StepEngine
+from src.integrator import INTEGRATORS, velocity_verlet_step
+from src.physics import confine, find_k_nearest, find_k_nearest_cells, make_force_kernel
+from src.neighbors import NeighborList
+from src.profiling import PhaseTimer, TraceWindow, format_phases
+from src.utils import get_element_counts, replica_settings
+
+def _crossed(previous_step, step, every):
+    # Engines may advance several steps per call, so cadences trigger on passing a multiple
+    return step // every > previous_step // every
 
 class Simulator:
     def __init__(self, particles, config, renderer=None):
@@ -15,22 +23,245 @@ class Simulator:
         self.coulomb_k = config['physics']['coulomb_constant']
         self.boundary_size = config['boundary']['size']
         self.restitution = config['boundary']['restitution']
+        self.periodic = config['boundary'].get('type', 'box') == 'periodic'
+        self.boundary_tensor = torch.tensor(self.boundary_size, device=particles.positions.device,
+                                            dtype=particles.positions.dtype)
+        image_box = self.boundary_size if self.periodic else None
+        
+        if config['physics'].get('neighbor_search', 'brute') == 'cell':
+            self.neighbor_fn = partial(find_k_nearest_cells, box_size=self.boundary_size,
+                                       cell_size=config['physics'].get('cell_size'), periodic=self.periodic)
+        else:
+            self.neighbor_fn = partial(find_k_nearest, box_size=image_box)
+        
+        self.neighbor_list = None
+        skin = config['physics'].get('neighbor_skin', 0.0)
+        if skin > 0:
+            self.neighbor_list = NeighborList(skin, self.neighbor_fn, image_box)
+            self.neighbor_fn = self.neighbor_list
+        
+        self.long_range = None
+        if config['physics'].get('electrostatics', 'knn') == 'pme' and torch.any(particles.charges != 0):
+            from src.electrostatics import ParticleMeshEwald
+            pme_config = config['physics'].get('pme', {})
+            self.long_range = ParticleMeshEwald(self.boundary_size, pme_config.get('grid_spacing', 1.5),
+                                                pme_config.get('alpha'), particles.positions.device,
+                                                particles.positions.dtype, pme_config.get('cutoff'))
+            self.neighbor_fn = self.long_range.watch(self.neighbor_fn)
+        self.ewald_warned = False
+        
+        self.force_kwargs = {
+            'neighbor_fn': self.neighbor_fn,
+            'pairwise': config['physics'].get('force_mode', 'knn') == 'pairs',
+            'long_range': self.long_range,
+            'box_size': image_box,
+            'kernel': make_force_kernel(config['physics'].get('force_backend', 'eager'),
+                                        config['physics'].get('precision', 'float32')),
+        }
+        
+        profiling = config.get('profiling', {})
+        self.profiling = profiling.get('enabled', False)
+        self.summary_every = profiling.get('summary_every', 0)
+        self.timer = PhaseTimer(particles.device, synchronize=self.profiling)
+        if self.profiling:
+            self.force_kwargs['neighbor_fn'] = self.timer.wrap('neighbor_search', self.force_kwargs['neighbor_fn'])
+            self.force_kwargs['kernel'] = self.timer.wrap('forces', self.force_kwargs['kernel'])
+        self.constrain = self.timer.wrap('boundary', self.confine)
+        
+        self.trace = None
+        if profiling.get('trace_start') is not None:
+            self.trace = TraceWindow(profiling['trace_start'], profiling['trace_stop'],
+                                     profiling.get('trace_path', 'trace.json'), particles.device)
+        
+        self.tally = None
+        self.observer = None
+        observables_config = config.get('output', {}).get('observables', {})
+        if observables_config.get('enabled', False):
+            from src.observables import EnergyTally, Observables
+            self.tally = EnergyTally()
+            self.observer = Observables(observables_config, particles, self.boundary_size, self.periodic)
         
         self.use_thermostat = config['physics']['thermostat'] != "none"
         self.target_temp = config['physics']['temperature']
+        if particles.batched:
+            _, temperatures = replica_settings(config)
+            if len(temperatures) == particles.n_replicas:
+                self.target_temp = torch.tensor(temperatures, device=particles.positions.device,
+                                                dtype=particles.positions.dtype)
         self.thermostat_tau = config['physics']['thermostat_tau']
         
         self.step = 0
+        self.steps_per_call = max(1, config['simulation'].get('steps_per_call', 1))
+        self.engine = None
+        self.render_every = max(1, config['simulation'].get('render_every', 1))
+        self.report_every = config['simulation'].get('report_every', 0)
         
         integrator_name = config['simulation']['integrator'].lower()
-        self.integrate = euler_step if integrator_name == 'euler' else velocity_verlet_step
+        if integrator_name == 'respa' and config['physics'].get('electrostatics', 'knn') != 'pme':
+            # kNN Coulomb is all short-range, so RESPA would have no slow forces to take outer steps on
+            raise ValueError("integrator RESPA needs physics.electrostatics: pme; its outer step only carries "
+                             "the PME reciprocal-space forces")
+        self.integrate = INTEGRATORS.get(integrator_name, velocity_verlet_step)
+        if integrator_name == 'respa':
+            self.integrate = partial(self.integrate, inner_steps=config['simulation'].get('respa_steps', 4))
         self.integrator_name = config['simulation']['integrator']
         
+        # Opened when the run starts, so a restored step can keep the frames written before it
+        self.trajectory = None
+        
+        self.checkpointer = None
+        checkpoint_config = config.get('output', {}).get('checkpoint', {})
+        if checkpoint_config.get('enabled', False):
+            from src.checkpoint import Checkpointer
+            self.checkpointer = Checkpointer(checkpoint_config)
+        
         self.fps = 0.0
+        self.steps_per_sec = 0.0
+        self.ns_per_day = 0.0
+    
+    def restore(self, state):
+        from src.checkpoint import config_hash
+        
+        meta = state['meta']
+        tensors = state['tensors']
+        if meta['config_hash'] != config_hash(self.config):
+            print("Warning: checkpoint was written with a different configuration")
+        
+        self.step = meta['step']
+        torch.set_rng_state(tensors['rng_state'].clone())
+        if 'cuda_rng_state' in tensors and torch.cuda.is_available():
+            torch.cuda.set_rng_state(tensors['cuda_rng_state'].clone())
+        
+        if self.neighbor_list is not None and meta['neighbor_list'] is not None:
+            device = self.particles.positions.device
+            self.neighbor_list.candidates = tensors['neighbor_candidates'].to(device)
+            self.neighbor_list.valid = tensors['neighbor_valid'].to(device)
+            self.neighbor_list.reference = tensors['neighbor_reference'].to(device)
+            for key, value in meta['neighbor_list'].items():
+                setattr(self.neighbor_list, key, value)
+    
+    def minimize(self):
+        from src.minimize import fire_minimize
+        
+        minimize_config = self.config.get('minimize', {})
+        result = fire_minimize(self.particles, self.k, self.coulomb_k, self.boundary_size, self.periodic,
+                               force_tol=minimize_config.get('force_tol', 1.0),
+                               max_iter=minimize_config.get('max_iter', 1000),
+                               dt=minimize_config.get('dt') or self.dt,
+                               dt_max=minimize_config.get('dt_max'),
+                               max_step=minimize_config.get('max_step', 0.2),
+                               **self.force_kwargs)
+        
+        status = "converged" if result['converged'] else "stopped"
+        print(f"FIRE minimization {status} after {result['iterations']} iterations | "
+              f"max force {result['initial_max_force']} -> {result['max_force']}")
+        return result
+    
+    def confine(self, particles):
+        confine(particles.positions, particles.velocities, self.boundary_tensor, self.restitution, self.periodic)
+    
+    def step_once(self, tally=None):
+        # Walls act inside the integrator, after the drift and before the new forces, so no step has to check
+        # on the host whether a collision made the cached forces stale. A tally is filled by the integrator's
+        # evaluation at the new positions, so sampled steps need no extra force pass
+        with self.timer.phase('integration'):
+            self.integrate(self.particles, self.dt, self.k, self.coulomb_k, constrain=self.constrain, tally=tally,
+                           **self.force_kwargs)
+        
+        if self.use_thermostat:
+            with self.timer.phase('thermostat'):
+                self.particles.apply_thermostat(self.target_temp, self.thermostat_tau, self.dt)
+    
+    def advance(self, sample=False):
+        # Built on first use so a restored checkpoint is in place before any CUDA graph capture; the profiling
+        # timers synchronize the device, which cannot happen inside a captured graph. Only calls that end on a
+        # sampled step pay for energy and virial, tallied in the last step's own force evaluation
+        if self.engine is None:
+            cuda_graph = self.config['simulation'].get('cuda_graph', True) and not self.profiling
+            self.engine = StepEngine(self, self.steps_per_call, cuda_graph)
+        steps = self.engine.run(self.tally if sample else None)
+        self.step += steps
+        self.timer.steps += steps
+    
+    def _render_view(self):
+        return self.particles.replica(0) if self.particles.batched else self.particles
+    
+    def _update_rate(self, steps, elapsed):
+        self.steps_per_sec = steps / max(elapsed, 1e-9)
+        self.ns_per_day = self.steps_per_sec * self.dt * 86400.0 * 1e-6
+    
+    def observables(self):
+        temperature = self.particles.temperature()
+        kinetic_energy = self.particles.kinetic_energy()
+        values = {
+            'step': self.step,
+            'temperature': temperature.tolist() if self.particles.batched else temperature.item(),
+            'kinetic_energy': kinetic_energy.tolist() if self.particles.batched else kinetic_energy.item(),
+        }
+        if self.tally is not None and self.tally.ready():
+            values['potential_energy'] = self.tally.potential().tolist()
+            values['virial'] = self.tally.virial().tolist()
+        return values
+    
+    def stats(self):
+        return {
+            'step': self.step,
+            'fps': self.fps,
+            'steps_per_sec': self.steps_per_sec,
+            'ns_per_day': self.ns_per_day,
+            'profile': self.timer.stats(),
+        }
+    
+    def _render(self):
+        with self.timer.phase('element_counting'):
+            element_counts = get_element_counts(self.particles)
+        with self.timer.phase('render'):
+            self.renderer.render(self._render_view(), self.fps, element_counts, self.integrator_name,
+                                 self.timer.per_step())
+    
+    def check_ewald(self):
+        if self.long_range is None or self.ewald_warned:
+            return
+        truncated = float(self.long_range.truncated)
+        if truncated > 0:
+            print(f"Warning: for up to {100 * truncated:.0f}% of atoms the k-th neighbor lies inside the Ewald "
+                  f"real-space cutoff ({self.long_range.cutoff:.1f} Å), so the real-space sum is truncated; "
+                  f"raise physics.k_neighbors or lower physics.pme.cutoff")
+            self.ewald_warned = True
+    
+    def report(self):
+        temperature = self.observables()['temperature']
+        if self.particles.batched:
+            temp_str = ' '.join(f"{t:.1f}" for t in temperature)
+        else:
+            temp_str = f"{temperature:.1f}"
+        print(f"Step {self.step} | {self.steps_per_sec:.1f} steps/s | {self.ns_per_day:.3f} ns/day | T: {temp_str} K | "
+              f"{format_phases(self.timer.per_step())}")
+        if self.trajectory:
+            print(self.trajectory.summary())
+        self.check_ewald()
     
     def run(self):
-        last_time = time.time()
+        trajectory_config = self.config.get('output', {}).get('trajectory', {})
+        if trajectory_config.get('enabled', False) and self.trajectory is None:
+            from src.trajectory import TrajectoryWriter
+            self.trajectory = TrajectoryWriter(trajectory_config, self.particles, self.dt,
+                                               resume_step=self.step if self.step > 0 else None)
+        
+        # Relax only fresh starts; a resumed run continues from already equilibrated positions
+        if self.config.get('minimize', {}).get('enabled', False) and self.step == 0:
+            self.minimize()
+            self.particles.invalidate_forces()
+            if self.observer:
+                self.tally.reset()
+                self.observer.rebase(self.particles)
+        
+        start_time = time.time()
+        start_step = self.step
+        last_time = start_time
         frame_count = 0
+        report_time = start_time
+        report_step = self.step
         
         while self.step < self.config['simulation']['steps']:
             if self.renderer and not self.renderer.running:
@@ -38,32 +269,81 @@ class Simulator:
             
             if self.renderer and self.renderer.paused:
                 element_counts = get_element_counts(self.particles)
-                self.renderer.render(self.particles, self.fps, element_counts, self.integrator_name)
+                self.renderer.render(self._render_view(), self.fps, element_counts, self.integrator_name,
+                                     self.timer.per_step())
                 time.sleep(0.016)
                 continue
             
-            self.integrate(self.particles, self.dt, self.k, self.coulomb_k)
+            if self.trace:
+                self.trace.update(self.step)
             
-            if self.particles.device == 'mps':
-                torch.mps.synchronize()
+            previous_step = self.step
+            self.advance(self.observer is not None
+                         and _crossed(self.step, self.step + self.steps_per_call, self.observer.every))
+            frame_count += 1
             
-            apply_boundary(self.particles, self.boundary_size, self.restitution)
+            if self.trajectory and _crossed(previous_step, self.step, self.trajectory.every):
+                self.trajectory.write(self.step, self.particles)
             
-            if self.use_thermostat:
-                self.particles.apply_thermostat(self.target_temp, self.thermostat_tau, self.dt)
+            if self.checkpointer and _crossed(previous_step, self.step, self.checkpointer.every):
+                self.checkpointer.save(self)
             
-            if self.renderer:
-                element_counts = get_element_counts(self.particles)
-                self.renderer.render(self.particles, self.fps, element_counts, self.integrator_name)
+            if self.renderer and _crossed(previous_step, self.step, self.render_every):
+                self._render()
             
-            self.step += 1
-            frame_count += 1
+            if self.report_every and _crossed(previous_step, self.step, self.report_every):
+                current_time = time.time()
+                self._update_rate(self.step - report_step, current_time - report_time)
+                self.report()
+                report_time = current_time
+                report_step = self.step
             
-            current_time = time.time()
-            if current_time - last_time >= 0.1:
-                self.fps = frame_count / (current_time - last_time)
-                frame_count = 0
-                last_time = current_time
+            if self.observer and _crossed(previous_step, self.step, self.observer.every):
+                self.observer.sample(self.particles, self.tally, self.step)
+            
+            if self.observer and self.observer.flush_every and _crossed(previous_step, self.step,
+                                                                        self.observer.flush_every):
+                self.observer.flush(self.dt)
+            
+            if self.summary_every and _crossed(previous_step, self.step, self.summary_every):
+                print(self.timer.summary())
+            
+            if self.renderer:
+                current_time = time.time()
+                if current_time - last_time >= 0.1:
+                    self.fps = frame_count / (current_time - last_time)
+                    frame_count = 0
+                    last_time = current_time
+        
+        elapsed = time.time() - start_time
+        self._update_rate(self.step - start_step, elapsed)
+        print(f"Completed {self.step - start_step} steps in {elapsed:.2f} s "
+              f"({self.steps_per_sec:.1f} steps/s, {self.ns_per_day:.3f} ns/day)")
+        
+        if self.trace:
+            self.trace.close()
+        
+        self.check_ewald()
+        
+        if self.observer:
+            self.observer.flush(self.dt)
+            print(f"Observables: {self.observer.flushed} summaries written to {self.observer.path}")
+        
+        if self.profiling:
+            print(self.timer.summary())
+        
+        if self.checkpointer:
+            self.checkpointer.close()
+            print(f"Checkpoints: {self.checkpointer.saved} written to {self.checkpointer.path} "
+                  f"({self.checkpointer.skipped} skipped while a write was in progress)")
+        
+        if self.trajectory:
+            self.trajectory.close()
+            print(self.trajectory.summary())
+        
+        if self.neighbor_list:
+            print(f"Neighbor list: {self.neighbor_list.builds} builds / {self.neighbor_list.queries} queries "
+                  f"(rebuild rate {self.neighbor_list.rebuild_rate:.3f})")
         
         if self.renderer:
             self.renderer.cleanup()
@@ -0,0 +1,120 @@
+import contextlib
+import copy
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import traceback
+import torch
+
+_OUTPUT_PATHS = ('trajectory', 'checkpoint', 'observables')
+
+def set_path(config, dotted_key, value):
+    node = config
+    keys = dotted_key.split('.')
+    for key in keys[:-1]:
+        node = node.setdefault(key, {})
+    node[keys[-1]] = value
+
+def expand_grid(grid):
+    # Cartesian product of {dotted.key: [values]} in key order; each variant is a dict of overrides
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+def variant_id(overrides):
+    return hashlib.sha1(json.dumps(overrides, sort_keys=True).encode()).hexdigest()[:12]
+
+def variant_config(base, overrides, run_id):
+    config = copy.deepcopy(base)
+    for key, value in overrides.items():
+        set_path(config, key, value)
+    
+    config['simulation']['headless'] = True
+    config['renderer']['enabled'] = False
+    
+    # Per-variant output files so concurrent workers never share a path
+    for name in _OUTPUT_PATHS:
+        section = config.get('output', {}).get(name)
+        if section and section.get('enabled', False) and section.get('path'):
+            stem, ext = os.path.splitext(section['path'])
+            section['path'] = f"{stem}.{run_id}{ext}"
+    return config
+
+def completed_ids(results_path):
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('status') == 'ok':
+                done.add(record['id'])
+    return done
+
+def _init_worker(threads):
+    torch.set_num_threads(threads)
+    with contextlib.suppress(RuntimeError):
+        torch.set_num_interop_threads(1)
+
+def run_variant(task):
+    from src.simulator import Simulator
+    from src.utils import create_particles
+    
+    run_id, overrides, config = task
+    record = {'id': run_id, 'overrides': overrides, 'pid': os.getpid(), 'threads': torch.get_num_threads()}
+    start = time.time()
+    try:
+        device = config['simulation'].get('device', 'cpu')
+        if (device == 'cuda' and not torch.cuda.is_available()) or (device == 'mps' and not torch.backends.mps.is_available()):
+            device = 'cpu'
+        torch.manual_seed(config.get('seed', 0))
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator = Simulator(create_particles(config, device), config)
+            simulator.run()
+        
+        stats = simulator.stats()
+        record.update({
+            'status': 'ok',
+            'steps': simulator.step,
+            'steps_per_sec': stats['steps_per_sec'],
+            'ns_per_day': stats['ns_per_day'],
+            'observables': simulator.observables(),
+        })
+    except Exception:
+        record.update({'status': 'error', 'error': traceback.format_exc(limit=5)})
+    record['elapsed'] = time.time() - start
+    return record
+
+def run_sweep(base, grid, results_path, workers=None, threads=1, resume=True, on_result=None):
+    # Results stream to one JSON-lines file from the parent process; with resume, variants already recorded as ok
+    # are skipped so an interrupted sweep picks up where it stopped
+    workers = workers or max(1, (os.cpu_count() or 1) // threads)
+    variants = [(variant_id(overrides), overrides) for overrides in expand_grid(grid)]
+    done = completed_ids(results_path) if resume else set()
+    tasks = [(run_id, overrides, variant_config(base, overrides, run_id))
+             for run_id, overrides in variants if run_id not in done]
+    
+    if not resume and os.path.exists(results_path):
+        os.remove(results_path)
+    
+    completed = []
+    if not tasks:
+        return completed
+    
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(min(workers, len(tasks)), initializer=_init_worker, initargs=(threads,)) as pool, \
+            open(results_path, 'a') as results:
+        for record in pool.imap_unordered(run_variant, tasks):
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+            completed.append(record)
+            if on_result:
+                on_result(record, len(completed), len(tasks))
+    return completed
@@ -0,0 +1,152 @@
+import os
+import queue
+import threading
+import time
+import h5py
+import numpy as np
+import torch
+
+_CHUNK_VALUES = 1 << 18
+
+class TrajectoryWriter:
+    def __init__(self, config, particles, dt, resume_step=None):
+        self.path = config.get('path', 'trajectory.h5')
+        self.every = max(1, config.get('every', 100))
+        self.dtype = torch.float16 if config.get('float16', False) else torch.float32
+        self.fields = ['positions', 'velocities'] if config.get('velocities', True) else ['positions']
+        
+        n = particles.n_particles
+        shape = tuple(particles.positions.shape)
+        rows = min(n, _CHUNK_VALUES // 3)
+        frames = max(1, min(config.get('chunk_frames', 16), _CHUNK_VALUES // (3 * n)))
+        chunks = (frames,) + (1,) * (len(shape) - 2) + (rows, 3)
+        compression = config.get('compression', 'gzip')
+        
+        if resume_step is not None and os.path.exists(self.path):
+            self._reopen(shape, resume_step)
+        else:
+            self.file = h5py.File(self.path, 'w')
+            self.datasets = [
+                self.file.create_dataset(name, shape=(0,) + shape, maxshape=(None,) + shape, chunks=chunks,
+                                         dtype='f2' if self.dtype == torch.float16 else 'f4', compression=compression)
+                for name in self.fields
+            ]
+            self.steps = self.file.create_dataset('step', shape=(0,), maxshape=(None,), chunks=(1024,), dtype='i8')
+            self._write_metadata(particles, dt)
+        
+        # The pool of host buffers bounds how many frames can be in flight
+        pin = particles.positions.is_cuda
+        self.free = queue.Queue()
+        for _ in range(max(1, config.get('queue_size', 8))):
+            self.free.put(torch.empty((len(self.fields),) + shape, dtype=self.dtype, pin_memory=pin))
+        self.pending = queue.Queue()
+        
+        self.frames_written = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.error = None
+        self.start_time = time.time()
+        
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+    
+    def _reopen(self, shape, resume_step):
+        # Frames after the checkpoint step came from the interrupted run and are rewritten by the resumed one
+        self.file = h5py.File(self.path, 'a')
+        missing = [name for name in self.fields + ['step'] if name not in self.file]
+        if missing or any(self.file[name].shape[1:] != shape for name in self.fields):
+            self.file.close()
+            raise ValueError(f"Trajectory {self.path} does not match this run; move it aside to start a new one")
+        
+        self.datasets = [self.file[name] for name in self.fields]
+        self.steps = self.file['step']
+        keep = int(np.searchsorted(self.steps[:], resume_step, side='right'))
+        for dataset in self.datasets + [self.steps]:
+            dataset.resize(keep, axis=0)
+    
+    def _write_metadata(self, particles, dt):
+        self.file.attrs['dt'] = dt
+        self.file.attrs['every'] = self.every
+        self.file.attrs['n_particles'] = particles.n_particles
+        self.file.create_dataset('species_id', data=particles.species_id.cpu().numpy().astype('i4'))
+        
+        n_species = len(particles.symbols)
+        species = self.file.create_group('species')
+        species.create_dataset('symbol', data=np.array(particles.symbols, dtype=h5py.string_dtype()))
+        species.create_dataset('count', data=torch.bincount(particles.species_id, minlength=n_species).cpu().numpy())
+        for name, values in [('mass', particles.masses), ('charge', particles.charges),
+                             ('lj_epsilon', particles.epsilons), ('lj_sigma', particles.sigmas)]:
+            per_species = torch.zeros(n_species, dtype=values.dtype, device=values.device)
+            per_species[particles.species_id] = values
+            species.create_dataset(name, data=per_species.cpu().numpy())
+    
+    def _worker(self):
+        try:
+            while True:
+                item = self.pending.get()
+                if item is None:
+                    break
+                
+                step, buffer, event = item
+                if event is not None:
+                    event.synchronize()
+                
+                frame = buffer.numpy()
+                index = self.steps.shape[0]
+                for i, dataset in enumerate(self.datasets):
+                    dataset.resize(index + 1, axis=0)
+                    dataset[index] = frame[i]
+                self.steps.resize(index + 1, axis=0)
+                self.steps[index] = step
+                
+                self.free.put(buffer)
+                self.frames_written += 1
+        except Exception as e:
+            self.error = e
+    
+    def write(self, step, particles):
+        if self.error is not None:
+            raise RuntimeError(f"Trajectory writer failed: {self.error}")
+        
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        
+        buffer[0].copy_(particles.positions, non_blocking=True)
+        if len(self.fields) > 1:
+            buffer[1].copy_(particles.velocities, non_blocking=True)
+        
+        event = None
+        if particles.positions.is_cuda:
+            event = torch.cuda.Event()
+            event.record()
+        elif particles.device == 'mps':
+            torch.mps.synchronize()
+        
+        self.pending.put((step, buffer, event))
+        self.max_depth = max(self.max_depth, self.pending.qsize())
+        return True
+    
+    def stats(self):
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        return {
+            'frames_written': self.frames_written,
+            'frames_per_sec': self.frames_written / elapsed,
+            'dropped': self.dropped,
+            'queue_depth': self.pending.qsize(),
+            'max_queue_depth': self.max_depth,
+        }
+    
+    def summary(self):
+        stats = self.stats()
+        return (f"Trajectory: {stats['frames_written']} frames ({stats['frames_per_sec']:.1f}/s) | "
+                f"queue {stats['queue_depth']}/{stats['max_queue_depth']} max | dropped {stats['dropped']}")
+    
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise RuntimeError(f"Trajectory writer failed: {self.error}")
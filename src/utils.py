@@ -1,87 +1,253 @@
-import yaml
-import torch
+import copy
+import hashlib
+import math
+import os
 import numpy as np
+import torch
 from src.particle import ParticleSystem
+from src.physics import build_pair_table
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ELEMENTS_PATH = os.path.join(PACKAGE_ROOT, 'elements.yaml')
+ELEMENT_FIELDS = ('mass', 'radius', 'lj_epsilon', 'lj_sigma', 'charge')
+
+_element_tables = {}
+
+def _compile_element_table(path, key):
+    import yaml
+    with open(path, 'r') as f:
+        elements = yaml.safe_load(f)['elements']
+    table = {field: np.array([e.get(field, 0.0) for e in elements.values()], dtype=np.float64)
+             for field in ELEMENT_FIELDS}
+    table['color'] = np.array([e['color'] for e in elements.values()], dtype=np.float64)
+    table['symbols'] = np.array(list(elements.keys()))
+    table['key'] = np.array(key)
+    return table
 
-_element_cache = None
+def load_element_table(path=None):
+    # Struct-of-arrays element data; the parsed YAML is cached as .npz beside it, keyed on the YAML's content hash
+    path = path or ELEMENTS_PATH
+    with open(path, 'rb') as f:
+        key = hashlib.sha1(f.read()).hexdigest()
+    
+    table = _element_tables.get(path)
+    if table is not None and table['key'] == key:
+        return table
+    
+    cache_path = os.path.splitext(path)[0] + '.npz'
+    table = None
+    try:
+        with np.load(cache_path) as data:
+            if str(data['key']) == key:
+                table = {name: data[name] for name in data.files}
+    except (OSError, KeyError, ValueError):
+        pass
+    
+    if table is None:
+        table = _compile_element_table(path, key)
+        try:
+            with open(cache_path + '.tmp', 'wb') as f:
+                np.savez(f, **table)
+            os.replace(cache_path + '.tmp', cache_path)
+        except OSError:
+            pass
+    
+    table['key'] = key
+    table['index'] = {str(symbol): i for i, symbol in enumerate(table['symbols'])}
+    _element_tables[path] = table
+    return table
 
-def load_elements():
-    global _element_cache
-    if _element_cache is None:
-        with open('elements.yaml', 'r') as f:
-            _element_cache = yaml.safe_load(f)['elements']
-    return _element_cache
+def load_elements(path=None):
+    table = load_element_table(path)
+    return {
+        symbol: {**{field: float(table[field][i]) for field in ELEMENT_FIELDS}, 'color': table['color'][i].tolist()}
+        for symbol, i in table['index'].items()
+    }
 
-def load_config():
-    with open('config.yaml', 'r') as f:
+def load_config(path='config.yaml'):
+    import yaml
+    with open(path, 'r') as f:
         return yaml.safe_load(f)
 
+FCC_BASIS = [[0.0, 0.0, 0.0], [0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]]
+CUBIC_BASIS = [[0.0, 0.0, 0.0]]
+
+def lattice_positions(n, box_size, basis=FCC_BASIS, device='cpu'):
+    # Largest lattice constant whose unit cells tile the box with at least n sites; sites are shuffled so species mix
+    box = torch.tensor(box_size, dtype=torch.float32, device=device)
+    basis = torch.tensor(basis, dtype=torch.float32, device=device)
+    a = (float(box.prod()) * len(basis) / n) ** (1.0 / 3.0)
+    cells = torch.clamp(torch.floor(box / a), min=1).long()
+    while int(cells.prod()) * len(basis) < n:
+        a *= 0.99
+        cells = torch.clamp(torch.floor(box / a), min=1).long()
+    spacing = box / cells
+    
+    axes = [torch.arange(int(c), dtype=torch.float32, device=device) for c in cells]
+    origins = torch.stack(torch.meshgrid(*axes, indexing='ij'), dim=-1).reshape(-1, 1, 3)
+    sites = ((origins + basis + 0.25) * spacing).reshape(-1, 3)
+    return sites[torch.randperm(len(sites), device=device)[:n]]
+
+def poisson_disk_positions(n, box_size, min_distance, periodic=False, device='cpu', batch=1 << 15, max_rounds=1000):
+    # Vectorized dart throwing on a grid with at most one point per cell (cell >= d/sqrt(3)), so only the
+    # +-2 neighboring cells can hold a point closer than min_distance
+    box = torch.tensor(box_size, dtype=torch.float32, device=device)
+    dims = torch.clamp(torch.floor(box * math.sqrt(3.0) / min_distance), min=1).long()
+    cell = box / dims
+    strides = torch.tensor([int(dims[1] * dims[2]), int(dims[2]), 1], device=device)
+    grid = torch.full((int(dims.prod()),), -1, dtype=torch.long, device=device)
+    points = torch.empty(n, 3, device=device)
+    offset_range = torch.arange(-2, 3, device=device)
+    offsets = torch.stack(torch.meshgrid(offset_range, offset_range, offset_range, indexing='ij'), dim=-1).reshape(-1, 3)
+    
+    count = 0
+    for _ in range(max_rounds):
+        if count == n:
+            return points
+        
+        candidates = torch.rand(min(batch, 4 * (n - count)), 3, device=device) * box
+        cells = torch.minimum((candidates / cell).long(), dims - 1)
+        flat = (cells * strides).sum(1)
+        
+        # One candidate per empty cell
+        free = grid[flat] < 0
+        candidates, cells, flat = candidates[free], cells[free], flat[free]
+        unique_cells, inverse = torch.unique(flat, return_inverse=True)
+        first = torch.full((len(unique_cells),), len(flat), device=device).scatter_reduce(
+            0, inverse, torch.arange(len(flat), device=device), reduce='amin')
+        first = first[torch.randperm(len(first), device=device)[:n - count]]
+        candidates, cells, flat = candidates[first], cells[first], flat[first]
+        
+        ids = count + torch.arange(len(flat), device=device)
+        grid[flat] = ids
+        points[ids] = candidates
+        
+        neighbor_cells = cells.unsqueeze(1) + offsets
+        if periodic:
+            inside = torch.ones(neighbor_cells.shape[:2], dtype=torch.bool, device=device)
+            neighbor_cells = torch.remainder(neighbor_cells, dims)
+        else:
+            inside = ((neighbor_cells >= 0) & (neighbor_cells < dims)).all(-1)
+            neighbor_cells = torch.minimum(torch.clamp(neighbor_cells, min=0), dims - 1)
+        neighbor_ids = grid[(neighbor_cells * strides).sum(-1)]
+        occupied = inside & (neighbor_ids >= 0) & (neighbor_ids != ids.unsqueeze(1))
+        
+        diff = candidates.unsqueeze(1) - points[torch.clamp(neighbor_ids, min=0)]
+        if periodic:
+            diff = diff - box * torch.round(diff / box)
+        close = occupied & (torch.sum(diff * diff, dim=-1) < min_distance ** 2)
+        
+        # Conflicts with placed points reject the candidate; between two new candidates the lower id wins
+        rejected = (close & (neighbor_ids < ids.unsqueeze(1))).any(1)
+        grid[flat[rejected]] = -1
+        accepted = ~rejected
+        placed = int(accepted.sum())
+        new_ids = count + torch.arange(placed, device=device)
+        grid[flat[accepted]] = new_ids
+        points[new_ids] = candidates[accepted]
+        count += placed
+    
+    if count < n:
+        raise ValueError(f"Placed only {count} of {n} particles {min_distance:.2f} Å apart in {list(box_size)}; "
+                         f"enlarge boundary.size or lower particles.min_distance")
+    return points
+
+def initial_positions(config, n, max_sigma, device):
+    particle_config = config['particles']
+    box_size = config['boundary']['size']
+    state = particle_config.get('initial_state', 'random')
+    
+    if state == 'fcc':
+        return lattice_positions(n, box_size, FCC_BASIS, device)
+    if state == 'lattice':
+        return lattice_positions(n, box_size, CUBIC_BASIS, device)
+    if state == 'poisson':
+        min_distance = particle_config.get('min_distance') or max_sigma
+        periodic = config['boundary'].get('type', 'box') == 'periodic'
+        return poisson_disk_positions(n, box_size, min_distance, periodic, device)
+    if state == 'random':
+        return torch.rand(n, 3, device=device) * torch.tensor(box_size, dtype=torch.float32, device=device)
+    raise ValueError(f"Unknown particles.initial_state '{state}' (random, poisson, fcc or lattice)")
+
 def create_particles(config, device):
-    elements_data = load_elements()
+    table = load_element_table()
     particle_config = config['particles']
     counts = particle_config['count']
+    symbols = list(counts.keys())
+    rows = [table['index'][symbol] for symbol in symbols]
     
-    positions_list = []
-    velocities_list = []
-    masses_list = []
-    charges_list = []
-    radii_list = []
-    colors_list = []
-    epsilons_list = []
-    sigmas_list = []
-    elements_list = []
+    def species_tensor(field):
+        return torch.tensor(table[field][rows], dtype=torch.float32, device=device)
     
-    boundary = config['boundary']['size']
-    temp = config['physics']['temperature']
-    k_b = 1.380649e-23
+    species_mass = species_tensor('mass')
+    species_charge = species_tensor('charge')
+    species_radius = species_tensor('radius')
+    species_color = species_tensor('color')
+    species_eps = species_tensor('lj_epsilon')
+    species_sigma = species_tensor('lj_sigma')
     
-    for symbol, count in counts.items():
-        element = elements_data[symbol]
-        
-        pos = torch.rand(count, 3) * 50.0 + 25.0
-        
-        mass_kg = element['mass'] * 1.66053906660e-27
-        v_thermal_m_s = np.sqrt(3 * k_b * temp / mass_kg)
-        v_thermal_A_fs = v_thermal_m_s * 1e-5
-        vel = (torch.randn(count, 3) * v_thermal_A_fs * particle_config.get('velocity_scale', 1.0))
-        
-        positions_list.append(pos)
-        velocities_list.append(vel)
-        masses_list.extend([element['mass']] * count)
-        charges_list.extend([element.get('charge', 0.0)] * count)
-        radii_list.extend([element['radius']] * count)
-        colors_list.extend([element['color']] * count)
-        epsilons_list.extend([element['lj_epsilon']] * count)
-        sigmas_list.extend([element['lj_sigma']] * count)
-        elements_list.extend([symbol] * count)
+    species_id = torch.repeat_interleave(torch.arange(len(symbols), device=device),
+                                         torch.tensor(list(counts.values()), device=device))
+    n = len(species_id)
     
-    positions = torch.cat(positions_list).to(device)
-    velocities = torch.cat(velocities_list).to(device)
-    masses = torch.tensor(masses_list, dtype=torch.float32).to(device)
-    charges = torch.tensor(charges_list, dtype=torch.float32).to(device)
-    radii = torch.tensor(radii_list, dtype=torch.float32).to(device)
-    colors = torch.tensor(colors_list, dtype=torch.float32).to(device)
-    epsilons = torch.tensor(epsilons_list, dtype=torch.float32).to(device)
-    sigmas = torch.tensor(sigmas_list, dtype=torch.float32).to(device)
+    temp = config['physics']['temperature']
+    k_b = 1.380649e-23
+    mass_kg = species_mass.double() * 1.66053906660e-27
+    v_thermal_A_fs = (torch.sqrt(3 * k_b * temp / mass_kg) * 1e-5).float()
+    velocities = (torch.randn(n, 3, device=device) * v_thermal_A_fs[species_id].unsqueeze(1)
+                  * particle_config.get('velocity_scale', 1.0))
     
     return ParticleSystem(
-        positions=positions,
+        positions=initial_positions(config, n, float(species_sigma.max()), device),
         velocities=velocities,
-        masses=masses,
-        charges=charges,
-        radii=radii,
-        colors=colors,
-        epsilons=epsilons,
-        sigmas=sigmas,
-        elements=elements_list,
-        device=device
+        masses=species_mass[species_id],
+        charges=species_charge[species_id],
+        radii=species_radius[species_id],
+        colors=species_color[species_id],
+        epsilons=species_eps[species_id],
+        sigmas=species_sigma[species_id],
+        elements=None,
+        device=device,
+        species_id=species_id,
+        pair_table=build_pair_table(species_eps, species_sigma, species_charge),
+        symbols=symbols
     )
 
+def create_replicas(config, device, seeds=None, temperatures=None):
+    count = len(seeds) if seeds is not None else len(temperatures)
+    replicas = []
+    for b in range(count):
+        replica_config = copy.deepcopy(config)
+        if temperatures is not None:
+            replica_config['physics']['temperature'] = temperatures[b]
+        if seeds is not None:
+            torch.manual_seed(seeds[b])
+        replicas.append(create_particles(replica_config, device))
+    
+    particles = replicas[0]
+    particles.positions = torch.stack([p.positions for p in replicas])
+    particles.velocities = torch.stack([p.velocities for p in replicas])
+    return particles
+
+def replica_settings(config):
+    replica_config = config.get('replicas', {})
+    count = replica_config.get('count', 1)
+    seeds = replica_config.get('seeds') or list(range(count))
+    temperatures = replica_config.get('temperatures') or [config['physics']['temperature']] * len(seeds)
+    return seeds, temperatures
+
+def make_renderer(config):
+    # GL modules are imported only when a window is actually wanted, so headless runs never load them
+    if not config['renderer']['enabled'] or config['simulation'].get('headless', False):
+        return None
+    if config['renderer'].get('async', False):
+        from src.async_renderer import AsyncRenderer
+        return AsyncRenderer(config['renderer'])
+    from src.renderer import Renderer
+    return Renderer(config['renderer'])
+
 def get_element_counts(particles):
-    counts = {}
-    for elem in particles.elements:
-        counts[elem] = counts.get(elem, 0) + 1
-    return counts
+    return particles.composition()
 
 def print_initial_system(particles, config):
     counts = get_element_counts(particles)
@@ -100,4 +266,6 @@ def print_initial_system(particles, config):
     for elem, count in sorted(counts.items()):
         print(f"  {elem}: {count}")
     print(f"  Total: {particles.n_particles}")
+    if particles.batched:
+        print(f"Replicas: {particles.n_replicas}")
     print("=" * 60)
@@ -0,0 +1,45 @@
+import argparse
+import yaml
+from src.sweep import run_sweep
+from src.utils import load_config
+
+def parse_grid(args):
+    grid = {}
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(yaml.safe_load(f) or {})
+    for item in args.param:
+        key, _, values = item.partition('=')
+        grid[key] = yaml.safe_load(values)
+    for key, values in grid.items():
+        if not isinstance(values, list):
+            grid[key] = [values]
+    return grid
+
+def main():
+    parser = argparse.ArgumentParser(description="AE - parameter sweep over config variants")
+    parser.add_argument('grid', nargs='?', help="YAML file mapping dotted config keys to lists of values")
+    parser.add_argument('--param', action='append', default=[],
+                        help="Extra grid axis, e.g. physics.temperature=[200,300,400]")
+    parser.add_argument('--config', default='config.yaml', help="Base configuration")
+    parser.add_argument('--output', default='sweep.jsonl', help="Aggregated results (JSON lines)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: cores / threads)")
+    parser.add_argument('--threads', type=int, default=1, help="torch threads per worker")
+    parser.add_argument('--fresh', action='store_true', help="Discard existing results instead of resuming")
+    args = parser.parse_args()
+    
+    grid = parse_grid(args)
+    if not grid:
+        parser.error("no parameter grid given")
+    
+    def progress(record, done, total):
+        status = f"{record['steps_per_sec']:.1f} steps/s" if record['status'] == 'ok' else "FAILED"
+        print(f"[{done}/{total}] {record['id']} {record['overrides']} {status} ({record['elapsed']:.1f} s)")
+    
+    completed = run_sweep(load_config(args.config), grid, args.output, args.workers, args.threads,
+                          resume=not args.fresh, on_result=progress)
+    failed = sum(record['status'] != 'ok' for record in completed)
+    print(f"Ran {len(completed)} variants ({failed} failed); results in {args.output}")
+
+if __name__ == "__main__":
+    main()
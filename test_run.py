@@ -2,8 +2,7 @@
 """Quick test of simulator with limited steps"""
 
 import torch
-from src.utils import load_config, create_particles, print_initial_system
-from src.renderer import Renderer
+from src.utils import load_config, create_particles, print_initial_system, make_renderer
 from src.simulator import Simulator
 
 def main():
@@ -21,11 +20,7 @@ def main():
     particles = create_particles(config, device)
     print_initial_system(particles, config)
     
-    renderer = None
-    if config['renderer']['enabled']:
-        renderer = Renderer(config['renderer'])
-    
-    simulator = Simulator(particles, config, renderer)
+    simulator = Simulator(particles, config, make_renderer(config))
     simulator.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import torch
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from src.async_renderer import AsyncRenderer, read_latest
+
+N = 4
+
+def frame(value):
+    return SimpleNamespace(positions=torch.full((N, 3), value), velocities=torch.full((N, 3), -value))
+
+@pytest.fixture
+def producer():
+    renderer = AsyncRenderer({})
+    renderer.allocate(N)
+    yield renderer
+    renderer.cleanup()
+
+@pytest.fixture
+def consumer(producer):
+    # Attaches to the shared block by name, as the viewer process does
+    shm = shared_memory.SharedMemory(name=producer.shm.name)
+    buffers = np.ndarray((2, 2, N, 3), dtype=np.float32, buffer=shm.buf)
+    yield buffers
+    del buffers
+    shm.close()
+
+def read(producer, buffers, seen=-1):
+    shown = np.zeros((2, N, 3), dtype=np.float32)
+    seen = read_latest(buffers, shown, producer._latest, producer._sequence, producer._locks, seen)
+    return shown, seen
+
+def test_latest_frame_wins(producer, consumer):
+    for value in [1.0, 2.0, 3.0]:
+        assert producer.publish(frame(value))
+    
+    shown, seen = read(producer, consumer)
+    assert seen == 3
+    assert (shown[0] == 3.0).all() and (shown[1] == -3.0).all()
+    assert producer.published == 3 and producer.dropped == 0
+
+def test_unchanged_sequence_skips_copy(producer, consumer):
+    producer.publish(frame(1.0))
+    _, seen = read(producer, consumer)
+    shown, again = read(producer, consumer, seen)
+    assert again == seen
+    assert (shown == 0.0).all()
+
+def test_busy_back_buffer_drops_frame(producer, consumer):
+    producer.publish(frame(1.0))
+    back = 1 - producer._latest.value
+    
+    # The viewer holding the back slot (still reading it) makes the producer drop instead of waiting
+    with producer._locks[back]:
+        assert not producer.publish(frame(2.0))
+    assert producer.dropped == 1
+    
+    shown, seen = read(producer, consumer)
+    assert seen == 1 and (shown[0] == 1.0).all()
+    
+    assert producer.publish(frame(3.0))
+    shown, _ = read(producer, consumer, seen)
+    assert (shown[0] == 3.0).all()
@@ -0,0 +1,42 @@
+import pytest
+import torch
+from src.utils import load_config, create_particles
+from src.simulator import Simulator
+from src.checkpoint import capture_state, write_checkpoint, load_checkpoint
+
+@pytest.fixture
+def simulator():
+    config = load_config()
+    config['simulation']['steps'] = 5
+    config['particles']['count'] = {'H': 6, 'He': 4}
+    config['physics']['neighbor_skin'] = 1.0
+    sim = Simulator(create_particles(config, 'cpu'), config)
+    for _ in range(3):
+        sim.advance()
+    return sim
+
+def test_checkpoint_roundtrip(simulator, tmp_path):
+    path = str(tmp_path / "state.ae")
+    tensors, meta = capture_state(simulator)
+    write_checkpoint(path, tensors, meta)
+    
+    particles, state = load_checkpoint(path, 'cpu')
+    assert state['meta']['step'] == 3
+    assert torch.equal(particles.positions, simulator.particles.positions)
+    assert torch.equal(particles.species_id, simulator.particles.species_id)
+    assert particles.composition() == {'H': 6, 'He': 4}
+
+def test_resume_restores_rng_and_neighbor_list(simulator, tmp_path):
+    path = str(tmp_path / "state.ae")
+    tensors, meta = capture_state(simulator)
+    write_checkpoint(path, tensors, meta)
+    expected = torch.rand(4)
+    
+    particles, state = load_checkpoint(path, 'cpu')
+    resumed = Simulator(particles, simulator.config)
+    resumed.restore(state)
+    
+    assert resumed.step == 3
+    assert torch.equal(torch.rand(4), expected)
+    assert resumed.neighbor_list.builds == simulator.neighbor_list.builds
+    assert torch.equal(resumed.neighbor_list.candidates, simulator.neighbor_list.candidates)
@@ -0,0 +1,111 @@
+import pytest
+import torch
+import torch.distributed as dist
+from src.domain import DomainDecomposition, DomainSimulator, launch, processor_grid
+from src.physics import compute_forces
+from src.utils import load_config, create_particles
+
+def domain_config(periodic):
+    config = load_config()
+    config['particles']['count'] = {'H': 80, 'He': 48}
+    config['boundary']['type'] = 'periodic' if periodic else 'box'
+    config['boundary']['size'] = [30.0, 30.0, 30.0]
+    config['physics']['neighbor_search'] = 'brute'
+    config['physics']['thermostat'] = 'none'
+    config['simulation']['integrator'] = 'Verlet'
+    config['distributed'] = {'halo': 12.0}
+    return config
+
+def make_system(config):
+    torch.manual_seed(0)
+    particles = create_particles(config, 'cpu')
+    spacing = torch.tensor([7.5, 7.5, 3.75])
+    grid = torch.stack(torch.meshgrid(torch.arange(4), torch.arange(4), torch.arange(8), indexing='ij'), dim=-1)
+    jitter = 0.2 * (torch.rand(128, 3) - 0.5)
+    particles.positions = (grid.reshape(-1, 3) + 0.5 + jitter) * spacing
+    return particles
+
+def check_forces_and_migration(rank, world_size, periodic, queue):
+    config = domain_config(periodic)
+    particles = make_system(config)
+    domain = DomainDecomposition(config['boundary']['size'], 12.0, periodic)
+    local, ids = domain.distribute(particles)
+    simulator = DomainSimulator(local, ids, config, domain)
+    
+    reference = compute_forces(particles, config['physics']['k_neighbors'], config['physics']['coulomb_constant'],
+                               box_size=config['boundary']['size'] if periodic else None)
+    forces_match = torch.allclose(simulator.particles.forces, reference[ids], rtol=1e-4,
+                                  atol=1e-4 * float(reference.abs().max()))
+    
+    simulator.particles.velocities.normal_(std=2.0)
+    simulator.run(5)
+    all_ids, positions, _ = domain.gather(simulator.particles, simulator.ids)
+    owned = bool(domain.owned_mask(simulator.particles.positions).all())
+    
+    if rank == 0:
+        queue.put((forces_match, all_ids.tolist(), owned))
+    else:
+        queue.put((forces_match, None, owned))
+
+def check_populate(rank, world_size, queue):
+    config = domain_config(periodic=False)
+    config['particles']['initial_state'] = 'poisson'
+    domain = DomainDecomposition(config['boundary']['size'], 12.0)
+    local, ids = domain.populate(config, seed=3)
+    queue.put((ids.tolist(), bool(domain.owned_mask(local.positions).all()), local.symbols,
+               torch.bincount(local.species_id, minlength=2).tolist()))
+
+def check_rejections(rank, world_size, queue):
+    config = domain_config(periodic=False)
+    particles = make_system(config)
+    rejected = []
+    for halo, electrostatics in [(4.0, 'knn'), (12.0, 'pme')]:
+        config['physics']['electrostatics'] = electrostatics
+        domain = DomainDecomposition(config['boundary']['size'], halo)
+        local, ids = domain.distribute(particles)
+        try:
+            DomainSimulator(local, ids, config, domain)
+            rejected.append(False)
+        except ValueError:
+            rejected.append(True)
+    queue.put(rejected)
+
+def test_processor_grid_minimizes_surface():
+    assert processor_grid(4, [100.0, 100.0, 100.0]) in [(1, 2, 2), (2, 1, 2), (2, 2, 1)]
+    assert processor_grid(2, [200.0, 50.0, 50.0]) == (2, 1, 1)
+    assert processor_grid(1, [10.0, 10.0, 10.0]) == (1, 1, 1)
+
+@pytest.mark.parametrize("periodic", [False, True])
+def test_halo_forces_and_migration(periodic):
+    if not dist.is_available():
+        pytest.skip("torch.distributed is not available")
+    
+    queue = torch.multiprocessing.get_context('spawn').SimpleQueue()
+    launch(check_forces_and_migration, 2, periodic, queue)
+    results = [queue.get() for _ in range(2)]
+    
+    assert all(forces_match for forces_match, _, _ in results)
+    assert all(owned for _, _, owned in results)
+    ids = next(ids for _, ids, _ in results if ids is not None)
+    assert ids == list(range(128))
+
+def test_populate_builds_only_the_local_share():
+    if not dist.is_available():
+        pytest.skip("torch.distributed is not available")
+    
+    queue = torch.multiprocessing.get_context('spawn').SimpleQueue()
+    launch(check_populate, 2, queue)
+    results = [queue.get() for _ in range(2)]
+    
+    assert sorted(i for ids, _, _, _ in results for i in ids) == list(range(128))
+    assert all(owned for _, owned, _, _ in results)
+    assert all(symbols == ['H', 'He'] for _, _, symbols, _ in results)
+    assert sorted(counts for _, _, _, counts in results) == [[40, 24], [40, 24]]
+
+def test_short_halo_and_pme_are_rejected():
+    if not dist.is_available():
+        pytest.skip("torch.distributed is not available")
+    
+    queue = torch.multiprocessing.get_context('spawn').SimpleQueue()
+    launch(check_rejections, 2, queue)
+    assert [queue.get() for _ in range(2)] == [[True, True], [True, True]]
@@ -0,0 +1,77 @@
+import math
+import pytest
+import torch
+from src.particle import ParticleSystem
+from src.physics import compute_forces
+from src.electrostatics import ParticleMeshEwald
+from src.observables import EnergyTally
+
+def ion_pair(separation):
+    return ParticleSystem(
+        positions=torch.tensor([[20.0, 20.0, 20.0], [20.0 + separation, 20.0, 20.0]]),
+        velocities=torch.zeros(2, 3),
+        masses=torch.ones(2),
+        charges=torch.tensor([1.0, -1.0]),
+        radii=torch.ones(2),
+        colors=torch.ones(2, 3),
+        epsilons=torch.zeros(2),
+        sigmas=torch.ones(2),
+        elements=['Na', 'Cl'],
+        device='cpu'
+    )
+
+@pytest.mark.parametrize("pairwise", [False, True])
+def test_pme_matches_direct_coulomb(pairwise):
+    particles = ion_pair(3.0)
+    pme = ParticleMeshEwald([40.0, 40.0, 40.0], grid_spacing=1.0)
+    
+    forces = compute_forces(particles, 1, 332.0, pairwise=pairwise, long_range=pme)
+    expected = 332.0 / 9.0
+    
+    assert forces[0, 0].item() == pytest.approx(expected, rel=0.05)
+    assert forces[1, 0].item() == pytest.approx(-expected, rel=0.05)
+    assert abs(forces[0, 1].item()) < 1e-2 * expected
+
+def test_pme_batched_matches_single():
+    particles = ion_pair(4.0)
+    pme = ParticleMeshEwald([40.0, 40.0, 40.0], grid_spacing=1.0)
+    
+    single = pme(particles.positions, particles.charges, 332.0)
+    batched = pme(torch.stack([particles.positions, particles.positions]), particles.charges, 332.0)
+    assert torch.allclose(batched[1], single, atol=1e-4)
+
+@pytest.mark.parametrize("pairwise", [False, True])
+def test_pme_tally_matches_direct_coulomb_energy(pairwise):
+    particles = ion_pair(3.0)
+    pme = ParticleMeshEwald([40.0, 40.0, 40.0], grid_spacing=1.0)
+    tally = EnergyTally()
+    
+    compute_forces(particles, 1, 332.0, pairwise=pairwise, long_range=pme, tally=tally)
+    expected = -332.0 / 3.0
+    
+    assert 'pme' in tally.terms
+    # Coulomb is homogeneous of degree -1, so its virial equals its energy
+    assert tally.potential().item() == pytest.approx(expected, rel=0.05)
+    assert tally.virial().item() == pytest.approx(expected, rel=0.05)
+
+def test_pme_cutoff_sets_alpha_and_mesh():
+    from src.electrostatics import ERFC_RANGE
+    pme = ParticleMeshEwald([40.0, 40.0, 40.0], grid_spacing=4.0, cutoff=6.0)
+    assert pme.alpha == pytest.approx(ERFC_RANGE / 6.0)
+    assert 40.0 / pme.dims[0] <= math.pi / (6.0 * pme.alpha)
+    
+    default = ParticleMeshEwald([40.0, 40.0, 40.0], grid_spacing=1.5)
+    assert default.cutoff == pytest.approx(ERFC_RANGE / default.alpha)
+
+def test_pme_flags_truncated_real_space_sum():
+    from src.physics import find_k_nearest
+    pme = ParticleMeshEwald([40.0, 40.0, 40.0], grid_spacing=1.0, cutoff=8.0)
+    search = pme.watch(find_k_nearest)
+    
+    sparse = torch.tensor([[5.0, 5.0, 5.0], [35.0, 35.0, 35.0]])
+    search(sparse, 1)
+    assert pme.truncated.item() == 0.0
+    
+    dense = torch.rand(64, 3) * 10.0
+    search(dense, 4)
+    assert pme.truncated.item() == 1.0
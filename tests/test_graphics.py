@@ -67,3 +67,65 @@ def test_renderer_color_modes():
     
     assert particles.colors.shape == (n, 3)
     assert torch.all((particles.colors >= 0) & (particles.colors <= 1))
+
+@pytest.fixture
+def renderer_module():
+    pytest.importorskip("glfw")
+    pytest.importorskip("OpenGL.GL")
+    from src import renderer
+    return renderer
+
+def make_particles(n=5):
+    from src.particle import ParticleSystem
+    return ParticleSystem(
+        positions=torch.rand(n, 3) * 10.0,
+        velocities=torch.tensor([[3.0, 4.0, 0.0]] * n),
+        masses=torch.arange(1, n + 1, dtype=torch.float32),
+        charges=torch.tensor([1.0, -1.0, 0.0, 1.0, -1.0])[:n],
+        radii=torch.ones(n),
+        colors=torch.rand(n, 3),
+        epsilons=torch.ones(n),
+        sigmas=torch.ones(n),
+        elements=['C'] * n,
+        device='cpu'
+    )
+
+def test_buffer_packing(renderer_module):
+    particles = make_particles()
+    arrays, mass_range = renderer_module.pack_static(particles)
+    positions, speed = renderer_module.pack_frame(particles)
+    
+    for array in list(arrays.values()) + [positions, speed]:
+        assert array.dtype == 'f4' and array.flags['C_CONTIGUOUS']
+    assert arrays['colors'].shape == (5, 3)
+    assert arrays['charges'].tolist() == [1.0, -1.0, 0.0, 1.0, -1.0]
+    assert mass_range == (1.0, 5.0)
+    assert positions.shape == (5, 3)
+    assert speed.tolist() == [5.0] * 5
+
+def test_static_buffers_upload_only_on_change(renderer_module):
+    renderer = object.__new__(renderer_module.Renderer)
+    renderer.static_key = None
+    particles = make_particles()
+    
+    assert renderer.static_stale(particles)
+    assert not renderer.static_stale(particles)
+    particles.charges = particles.charges.clone()
+    assert renderer.static_stale(particles)
+
+def test_mvp_is_cached_until_camera_moves(renderer_module):
+    renderer = object.__new__(renderer_module.Renderer)
+    renderer.config = {'camera': {'position': [50.0, 50.0, 150.0], 'look_at': [50.0, 50.0, 50.0]}}
+    renderer.window_size = (960, 540)
+    renderer._mvp = None
+    
+    mvp = renderer.mvp
+    assert renderer.mvp is mvp
+    assert mvp.flags['C_CONTIGUOUS'] and mvp.dtype == 'f4'
+    
+    # Stored transposed for GL, so clip = point @ mvp; the look-at point lands at the screen center
+    clip = [50.0, 50.0, 50.0, 1.0] @ mvp
+    assert abs(clip[0] / clip[3]) < 1e-5 and abs(clip[1] / clip[3]) < 1e-5
+    
+    renderer.set_camera([0.0, 0.0, 150.0], [0.0, 0.0, 0.0])
+    assert renderer.mvp is not mvp
@@ -30,3 +30,24 @@ def test_src_imports():
     from src.utils import load_elements, load_config
     from src.simulator import Simulator
     assert all([ParticleSystem, compute_forces, rk4_step, load_elements, load_config, Simulator])
+
+IMPORT_BUDGET_SECONDS = 0.5
+
+def test_startup_import_budget():
+    import subprocess
+    import sys
+    code = (
+        "import sys, time, torch\n"
+        "start = time.perf_counter()\n"
+        "import src.simulator, src.utils\n"
+        "src.utils.load_element_table()\n"
+        "print(time.perf_counter() - start)\n"
+        "print(' '.join(m for m in ('glfw', 'OpenGL', 'yaml', 'h5py') if m in sys.modules))\n"
+    )
+    # The first run may have to compile the element cache; the second must hit it
+    subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    elapsed, heavy = (output.splitlines() + [''])[:2]
+    
+    assert heavy == ''
+    assert float(elapsed) < IMPORT_BUDGET_SECONDS
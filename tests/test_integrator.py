@@ -0,0 +1,125 @@
+import torch
+from src.particle import ParticleSystem
+from src.physics import compute_forces, confine, find_k_nearest, force_kernel, apply_boundary
+from src.integrator import euler_step, velocity_verlet_step, rk4_step, respa_step
+from src.electrostatics import ParticleMeshEwald
+
+def make_particles():
+    torch.manual_seed(0)
+    lattice = torch.tensor([[i, j, l] for i in range(2) for j in range(2) for l in range(2)], dtype=torch.float32)
+    n = len(lattice)
+    return ParticleSystem(
+        positions=lattice * 3.8 + 10.0 + torch.rand(n, 3) * 0.1,
+        velocities=torch.randn(n, 3) * 0.01,
+        masses=torch.ones(n) * 12.0,
+        charges=torch.zeros(n),
+        radii=torch.ones(n) * 1.7,
+        colors=torch.ones(n, 3) * 0.5,
+        epsilons=torch.ones(n) * 0.105,
+        sigmas=torch.ones(n) * 3.4,
+        elements=['C'] * n,
+        device='cpu'
+    )
+
+def make_charged_particles():
+    particles = make_particles()
+    particles.charges = torch.tensor([0.5, -0.5] * (particles.n_particles // 2))
+    return particles
+
+class CountingSearch:
+    def __init__(self):
+        self.calls = 0
+    
+    def __call__(self, positions, k):
+        self.calls += 1
+        return find_k_nearest(positions, k)
+
+class CountingMesh:
+    def __init__(self, mesh):
+        self.mesh = mesh
+        self.alpha = mesh.alpha
+        self.calls = 0
+    
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.mesh(*args, **kwargs)
+
+def test_verlet_reuses_forces():
+    particles = make_particles()
+    search = CountingSearch()
+    
+    for _ in range(5):
+        velocity_verlet_step(particles, 0.1, 4, 332.0, neighbor_fn=search)
+    
+    assert search.calls == 6
+    assert particles.forces is not None
+
+def test_boundary_hit_invalidates_forces():
+    particles = make_particles()
+    velocity_verlet_step(particles, 0.1, 4, 332.0)
+    
+    apply_boundary(particles, [100.0, 100.0, 100.0], 1.0)
+    assert particles.forces is not None
+    
+    particles.positions[0, 0] = -1.0
+    apply_boundary(particles, [100.0, 100.0, 100.0], 1.0)
+    assert particles.forces is None
+
+def test_constrained_verlet_caches_forces_at_confined_positions():
+    particles = make_particles()
+    particles.velocities[0, 0] = -200.0
+    boundary = torch.tensor([100.0, 100.0, 100.0])
+    
+    def constrain(p):
+        confine(p.positions, p.velocities, boundary, 1.0)
+    
+    velocity_verlet_step(particles, 0.1, 4, 332.0, constrain=constrain)
+    assert particles.positions[0, 0] == 0.0
+    assert particles.velocities[0, 0] > 0
+    assert torch.allclose(particles.forces, compute_forces(particles, 4, 332.0))
+
+def test_euler_invalidates_forces():
+    particles = make_particles()
+    euler_step(particles, 0.1, 4, 332.0)
+    assert particles.forces is None
+
+def test_rk4_agrees_with_verlet():
+    verlet = make_particles()
+    rk4 = make_particles()
+    
+    for _ in range(10):
+        velocity_verlet_step(verlet, 0.01, 4, 332.0)
+        rk4_step(rk4, 0.01, 4, 332.0)
+    
+    assert not torch.any(torch.isnan(rk4.positions))
+    assert torch.allclose(rk4.positions, verlet.positions, atol=1e-3)
+
+def test_respa_single_inner_step_is_verlet():
+    verlet = make_charged_particles()
+    respa = make_charged_particles()
+    
+    for _ in range(5):
+        velocity_verlet_step(verlet, 0.05, 4, 332.0)
+        respa_step(respa, 0.05, 4, 332.0, inner_steps=1)
+    
+    assert torch.allclose(respa.positions, verlet.positions, atol=1e-5)
+    assert torch.allclose(respa.velocities, verlet.velocities, atol=1e-5)
+
+def test_respa_evaluates_mesh_once_per_step():
+    particles = make_charged_particles()
+    search = CountingSearch()
+    mesh = CountingMesh(ParticleMeshEwald([30.0, 30.0, 30.0]))
+    terms = []
+    
+    def kernel(*args, lj=True, coulomb=True, **kwargs):
+        terms.append('lj' if lj and not coulomb else 'coulomb' if coulomb and not lj else 'all')
+        return force_kernel(*args, lj=lj, coulomb=coulomb, **kwargs)
+    
+    for _ in range(3):
+        respa_step(particles, 0.1, 4, 332.0, inner_steps=4, neighbor_fn=search, kernel=kernel, long_range=mesh)
+    
+    # Real-space Coulomb rides with LJ in every sub-step; only the mesh waits for the outer step
+    assert search.calls == 3
+    assert mesh.calls == 1 + 3
+    assert terms == ['all'] * (1 + 3 * 4)
+    assert particles.slow_forces is not None
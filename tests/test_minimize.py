@@ -0,0 +1,65 @@
+import json
+import torch
+from src.minimize import fire_minimize
+from src.physics import compute_forces
+from src.simulator import Simulator
+from src.utils import load_config, create_particles, create_replicas
+
+def overlapping_config():
+    config = load_config()
+    config['particles']['initial_state'] = 'random'
+    config['particles']['count'] = {'He': 40, 'Ne': 20}
+    config['boundary']['size'] = [20.0, 20.0, 20.0]
+    return config
+
+def test_fire_relaxes_overlapping_start():
+    config = overlapping_config()
+    torch.manual_seed(0)
+    particles = create_particles(config, 'cpu')
+    
+    result = fire_minimize(particles, 8, config['physics']['coulomb_constant'], config['boundary']['size'],
+                           force_tol=0.5, max_iter=2000)
+    
+    forces = compute_forces(particles, 8, config['physics']['coulomb_constant'])
+    assert result['converged']
+    assert result['max_force'] < result['initial_max_force']
+    assert torch.linalg.norm(forces, dim=-1).max() <= 0.5
+    assert (particles.positions >= 0).all() and (particles.positions <= 20.0).all()
+
+def test_fire_relaxes_replicas_independently():
+    config = overlapping_config()
+    particles = create_replicas(config, 'cpu', seeds=[0, 1])
+    
+    result = fire_minimize(particles, 8, config['physics']['coulomb_constant'], config['boundary']['size'],
+                           force_tol=0.5, max_iter=2000)
+    
+    assert len(result['max_force']) == 2
+    assert all(force <= 0.5 for force in result['max_force'])
+
+def test_simulator_minimizes_before_run(capsys):
+    config = overlapping_config()
+    config['simulation'].update({'device': 'cpu', 'steps': 5, 'headless': True, 'report_every': 0})
+    config['renderer']['enabled'] = False
+    config['minimize'] = {'enabled': True, 'force_tol': 0.5, 'max_iter': 2000}
+    simulator = Simulator(create_particles(config, 'cpu'), config)
+    simulator.run()
+    
+    assert "FIRE minimization converged" in capsys.readouterr().out
+    assert simulator.step == 5
+
+def test_minimization_is_not_counted_as_diffusion(tmp_path):
+    config = overlapping_config()
+    config['simulation'].update({'device': 'cpu', 'steps': 2, 'headless': True, 'report_every': 0})
+    config['renderer']['enabled'] = False
+    config['minimize'] = {'enabled': True, 'force_tol': 0.5, 'max_iter': 2000}
+    config['output']['observables'] = {'enabled': True, 'every': 1, 'path': str(tmp_path / "observables.jsonl")}
+    torch.manual_seed(0)
+    particles = create_particles(config, 'cpu')
+    start = particles.positions.clone()
+    simulator = Simulator(particles, config)
+    simulator.run()
+    
+    relaxed = torch.sum((simulator.particles.positions - start) ** 2, dim=-1).mean()
+    summary = json.loads(open(tmp_path / "observables.jsonl").readline())
+    assert relaxed > 0.1
+    assert summary['msd']['values'][0] < 1e-2
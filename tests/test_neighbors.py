@@ -0,0 +1,73 @@
+import pytest
+import torch
+from src.physics import find_k_nearest
+from src.neighbors import NeighborList
+
+def test_neighbor_list_matches_search():
+    positions = torch.rand(200, 3) * 30.0
+    neighbor_list = NeighborList(skin=1.0)
+    
+    distances, indices = neighbor_list(positions, 8)
+    expected, _ = find_k_nearest(positions, 8)
+    assert indices.shape == (200, 8)
+    assert torch.allclose(distances, expected, atol=1e-4)
+
+def test_neighbor_list_reused_within_skin():
+    positions = torch.rand(200, 3) * 30.0
+    neighbor_list = NeighborList(skin=1.0)
+    neighbor_list(positions, 8)
+    
+    for _ in range(5):
+        positions = positions + (torch.rand(200, 3) - 0.5) * 0.05
+        distances, _ = neighbor_list(positions, 8)
+        expected, _ = find_k_nearest(positions, 8)
+        assert torch.allclose(distances, expected, atol=1e-4)
+    
+    assert neighbor_list.builds == 1
+    assert neighbor_list.rebuild_rate == pytest.approx(1 / 6)
+
+def test_neighbor_list_rebuilds_after_large_move():
+    positions = torch.rand(100, 3) * 30.0
+    neighbor_list = NeighborList(skin=0.5)
+    neighbor_list(positions, 4)
+    
+    positions[0] += 1.0
+    distances, _ = neighbor_list(positions, 4)
+    expected, _ = find_k_nearest(positions, 4)
+    
+    assert neighbor_list.builds == 2
+    assert torch.allclose(distances, expected, atol=1e-4)
+
+def test_scheduled_neighbor_list_reports_breach():
+    positions = torch.rand(100, 3) * 30.0
+    velocities = torch.zeros(100, 3)
+    neighbor_list = NeighborList(skin=1.0)
+    neighbor_list.schedule(positions, velocities, 4, 1.0)
+    for _ in range(3):
+        positions = positions + 0.01
+        neighbor_list(positions, 4)
+    assert not neighbor_list.unschedule()
+    
+    # Inside a window nothing is rebuilt, but the largest displacement is still tracked
+    neighbor_list.schedule(positions, velocities, 4, 1.0)
+    positions = positions.clone()
+    positions[0] += 1.0
+    neighbor_list(positions, 4)
+    assert neighbor_list.unschedule()
+    assert neighbor_list.builds == 1
+
+def test_schedule_looks_ahead_along_velocity_and_acceleration():
+    positions = torch.rand(100, 3) * 30.0
+    velocities = torch.zeros(100, 3)
+    neighbor_list = NeighborList(skin=1.0)
+    neighbor_list.schedule(positions, velocities, 4, 1.0)
+    neighbor_list.schedule(positions, velocities, 4, 1.0, accelerations=torch.zeros(100, 3))
+    assert neighbor_list.builds == 1
+    
+    accelerations = torch.zeros(100, 3)
+    accelerations[0, 0] = 1.0
+    neighbor_list.schedule(positions, velocities, 4, 1.0, accelerations=accelerations)
+    assert neighbor_list.builds == 2
+    
+    neighbor_list.schedule(positions, torch.full((100, 3), 1.0), 4, 1.0)
+    assert neighbor_list.builds == 3
@@ -0,0 +1,94 @@
+import json
+import pytest
+import torch
+from src.observables import EnergyTally
+from src.particle import ParticleSystem
+from src.physics import compute_forces
+from src.simulator import Simulator
+from src.utils import load_config, create_particles
+
+def dimer(separation):
+    return ParticleSystem(
+        positions=torch.tensor([[0.0, 0.0, 0.0], [separation, 0.0, 0.0]], dtype=torch.float64),
+        velocities=torch.zeros(2, 3, dtype=torch.float64),
+        masses=torch.ones(2) * 12.0,
+        charges=torch.tensor([0.5, -0.5], dtype=torch.float64),
+        radii=torch.ones(2),
+        colors=torch.ones(2, 3),
+        epsilons=torch.ones(2, dtype=torch.float64) * 0.105,
+        sigmas=torch.ones(2, dtype=torch.float64) * 3.4,
+        elements=['C', 'C'],
+        device='cpu'
+    )
+
+@pytest.mark.parametrize("pairwise", [False, True])
+def test_tally_matches_energy_gradient_and_virial(pairwise):
+    tally = EnergyTally()
+    forces = compute_forces(dimer(4.0), k=1, coulomb_k=332.0, pairwise=pairwise, tally=tally)
+    
+    energies = []
+    for separation in [4.0 - 1e-5, 4.0 + 1e-5]:
+        probe = EnergyTally()
+        compute_forces(dimer(separation), k=1, coulomb_k=332.0, pairwise=pairwise, tally=probe)
+        energies.append(probe.potential())
+    
+    gradient_force = -(energies[1] - energies[0]) / 2e-5
+    assert torch.allclose(forces[1, 0], gradient_force, rtol=1e-5)
+    assert torch.allclose(tally.virial(), 4.0 * forces[1, 0], rtol=1e-6)
+
+def test_observables_flush_summaries(tmp_path):
+    config = load_config()
+    config['simulation'].update({'device': 'cpu', 'steps': 40, 'headless': True, 'integrator': 'Verlet'})
+    config['renderer']['enabled'] = False
+    config['output']['observables'] = {'enabled': True, 'every': 5, 'flush_every': 20, 'rdf_bins': 24,
+                                       'path': str(tmp_path / "observables.jsonl")}
+    simulator = Simulator(create_particles(config, 'cpu'), config)
+    simulator.run()
+    
+    lines = [json.loads(line) for line in open(tmp_path / "observables.jsonl")]
+    assert len(lines) == 2
+    assert lines[0]['samples'] == 4 and lines[0]['steps'] == [5, 20]
+    assert len(lines[0]['rdf']['g']) == 24
+    assert len(lines[1]['msd']['values']) == 4
+    for name in ['potential', 'kinetic', 'pressure', 'temperature']:
+        assert torch.isfinite(torch.tensor(lines[1]['averages'][name]['mean']))
+    assert 'potential_energy' in simulator.observables()
+
+@pytest.mark.parametrize("integrator", ['Euler', 'RK4', 'Verlet', 'RESPA'])
+def test_tally_is_taken_at_sampled_positions(tmp_path, integrator):
+    config = load_config()
+    config['simulation'].update({'device': 'cpu', 'steps': 10, 'headless': True, 'integrator': integrator})
+    config['renderer']['enabled'] = False
+    config['output']['observables'] = {'enabled': True, 'every': 5, 'path': str(tmp_path / "observables.jsonl")}
+    if integrator == 'RESPA':
+        config['physics']['electrostatics'] = 'pme'
+    torch.manual_seed(0)
+    simulator = Simulator(create_particles(config, 'cpu'), config)
+    assert 'tally' not in simulator.force_kwargs
+    simulator.run()
+    
+    reference = EnergyTally()
+    compute_forces(simulator.particles, simulator.k, simulator.coulomb_k, tally=reference, **simulator.force_kwargs)
+    assert torch.allclose(simulator.tally.potential(), reference.potential(), rtol=1e-4)
+    assert torch.allclose(simulator.tally.virial(), reference.virial(), rtol=1e-4, atol=1e-3)
+
+@pytest.mark.parametrize("integrator", ['Euler', 'RK4', 'Verlet'])
+def test_sampling_adds_no_neighbor_searches(tmp_path, integrator):
+    searches = []
+    for enabled in [False, True]:
+        config = load_config()
+        config['simulation'].update({'device': 'cpu', 'steps': 10, 'headless': True, 'integrator': integrator,
+                                     'steps_per_call': 5})
+        config['renderer']['enabled'] = False
+        config['output']['observables'] = {'enabled': enabled, 'every': 5, 'path': str(tmp_path / "observables.jsonl")}
+        torch.manual_seed(0)
+        simulator = Simulator(create_particles(config, 'cpu'), config)
+        calls = []
+        search = simulator.force_kwargs['neighbor_fn']
+        simulator.force_kwargs['neighbor_fn'] = lambda positions, k: calls.append(1) or search(positions, k)
+        simulator.run()
+        searches.append(len(calls))
+    
+    # Euler and RK4 pull the next step's first evaluation forward, so only the very last sample adds one
+    extra = 0 if integrator == 'Verlet' else 1
+    assert searches[1] == searches[0] + extra
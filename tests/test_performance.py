@@ -67,3 +67,33 @@ def test_mps_acceleration():
     
     print(f"\nCPU: {time_cpu:.4f}s, MPS: {time_mps:.4f}s")
     assert time_cpu >= 0 and time_mps >= 0
+
+def test_benchmark_harness_cases_run_headless():
+    from benchmarks.harness import CASES, format_table, run_suite
+    
+    results = run_suite(load_config(), list(CASES), [100], min_time=0.0, isolate=False)
+    
+    assert [r['case'] for r in results] == list(CASES)
+    assert all(r['time'] > 0 and r['per_sec'] > 0 for r in results)
+    assert "forces" in format_table(results)
+
+def test_benchmark_regressions_flagged_past_threshold():
+    from benchmarks.harness import compare
+    
+    baseline = {'results': [{'case': 'forces', 'n': 100, 'time': 1.0}, {'case': 'boundary', 'n': 100, 'time': 1.0}]}
+    results = [{'case': 'forces', 'n': 100, 'time': 1.5}, {'case': 'boundary', 'n': 100, 'time': 1.1}]
+    
+    regressions = compare(results, baseline, threshold=0.2)
+    
+    assert [r['case'] for r in regressions] == ['forces']
+    assert results[1]['baseline_ratio'] == pytest.approx(1.1)
+
+def test_benchmark_harness_does_not_load_distributed_stack():
+    import subprocess
+    import sys
+    code = ("import sys\n"
+            "from benchmarks.harness import measure\n"
+            "from src.utils import load_config\n"
+            "measure('forces', 100, load_config(), min_time=0.0)\n"
+            "sys.exit(int('src.domain' in sys.modules or 'benchmarks.scaling' in sys.modules))\n")
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
@@ -1,7 +1,8 @@
 import pytest
 import torch
 from src.particle import ParticleSystem
-from src.physics import find_k_nearest, compute_forces
+from src.utils import load_config, create_particles
+from src.physics import find_k_nearest, find_k_nearest_cells, find_pairs, compute_forces, make_force_kernel, apply_boundary
 
 @pytest.fixture
 def simple_particles():
@@ -27,6 +28,54 @@ def test_k_nearest(simple_particles):
     assert indices.shape == (simple_particles.n_particles, k)
     assert torch.all(distances >= 0)
 
+def test_cell_list_matches_brute_force():
+    positions = torch.rand(500, 3) * 40.0
+    brute_distances, _ = find_k_nearest(positions, 8)
+    cell_distances, cell_indices = find_k_nearest_cells(positions, 8, [40.0, 40.0, 40.0])
+    assert cell_indices.shape == (500, 8)
+    assert torch.allclose(cell_distances, brute_distances, atol=1e-4)
+    assert not torch.any(cell_indices == torch.arange(500).unsqueeze(1))
+
+def test_cell_list_outside_box():
+    positions = torch.rand(50, 3) * 20.0 - 5.0
+    brute_distances, _ = find_k_nearest(positions, 4)
+    cell_distances, _ = find_k_nearest_cells(positions, 4, [10.0, 10.0, 10.0], cell_size=2.0)
+    assert torch.allclose(cell_distances, brute_distances, atol=1e-4)
+
+def test_periodic_cell_list_matches_brute_force():
+    positions = torch.rand(400, 3) * 30.0
+    brute_distances, _ = find_k_nearest(positions, 8, box_size=[30.0, 30.0, 30.0])
+    cell_distances, _ = find_k_nearest_cells(positions, 8, [30.0, 30.0, 30.0], periodic=True)
+    assert torch.allclose(cell_distances, brute_distances, atol=1e-4)
+
+def test_periodic_neighbors_wrap():
+    positions = torch.tensor([[0.5, 5.0, 5.0], [9.5, 5.0, 5.0], [5.0, 5.0, 5.0]])
+    distances, indices = find_k_nearest(positions, 1, box_size=[10.0, 10.0, 10.0])
+    assert indices[0, 0].item() == 1
+    assert distances[0, 0].item() == pytest.approx(1.0, abs=1e-5)
+
+def test_periodic_forces_use_minimum_image(simple_particles):
+    simple_particles.positions = torch.tensor([[0.5, 5.0, 5.0], [9.5, 5.0, 5.0]])
+    simple_particles.species_id = simple_particles.species_id[:2]
+    for name in ['masses', 'charges', 'epsilons', 'sigmas']:
+        setattr(simple_particles, name, getattr(simple_particles, name)[:2])
+    
+    wrapped = compute_forces(simple_particles, 1, 332.0, box_size=[10.0, 10.0, 10.0])
+    simple_particles.positions = torch.tensor([[5.5, 5.0, 5.0], [4.5, 5.0, 5.0]])
+    direct = compute_forces(simple_particles, 1, 332.0)
+    assert torch.allclose(wrapped, direct, rtol=1e-4)
+
+def test_apply_boundary_modes(simple_particles):
+    simple_particles.positions[0] = torch.tensor([-1.0, 5.0, 12.0])
+    simple_particles.velocities[0] = torch.tensor([-2.0, 1.0, 3.0])
+    apply_boundary(simple_particles, [10.0, 10.0, 10.0], 0.5)
+    assert torch.allclose(simple_particles.positions[0], torch.tensor([0.0, 5.0, 10.0]))
+    assert torch.allclose(simple_particles.velocities[0], torch.tensor([1.0, 1.0, -1.5]))
+    
+    simple_particles.positions[0] = torch.tensor([-1.0, 5.0, 12.0])
+    apply_boundary(simple_particles, [10.0, 10.0, 10.0], 0.5, periodic=True)
+    assert torch.allclose(simple_particles.positions[0], torch.tensor([9.0, 5.0, 2.0]))
+
 def test_combined_forces(simple_particles):
     forces = compute_forces(simple_particles, k=4, coulomb_k=8.9875517923e+9)
     assert forces.shape == simple_particles.positions.shape
@@ -38,6 +87,72 @@ def test_forces_with_charges(simple_particles):
     assert forces.shape == simple_particles.positions.shape
     assert not torch.any(torch.isnan(forces))
 
+def test_find_pairs_unique():
+    indices = torch.tensor([[1, 2], [0, 2], [0, 1]])
+    i, j = find_pairs(indices)
+    assert torch.equal(i, torch.tensor([0, 0, 1]))
+    assert torch.equal(j, torch.tensor([1, 2, 2]))
+
+def test_pair_forces_conserve_momentum(simple_particles):
+    simple_particles.charges = torch.randn(simple_particles.n_particles)
+    forces = compute_forces(simple_particles, k=4, coulomb_k=332.0, pairwise=True)
+    assert forces.shape == simple_particles.positions.shape
+    assert torch.allclose(forces.sum(dim=0), torch.zeros(3), atol=1e-3 * forces.abs().max().item())
+
+def test_pair_forces_match_knn_for_full_lists(simple_particles):
+    n = simple_particles.n_particles
+    knn = compute_forces(simple_particles, k=n - 1, coulomb_k=332.0)
+    pairs = compute_forces(simple_particles, k=n - 1, coulomb_k=332.0, pairwise=True)
+    assert torch.allclose(knn, pairs, atol=1e-4 * knn.abs().max().item())
+
+def test_pair_table_matches_per_particle_mixing():
+    config = load_config()
+    config['particles']['count'] = {'H': 20, 'He': 10, 'Ne': 10}
+    particles = create_particles(config, 'cpu')
+    
+    table_forces = compute_forces(particles, k=8, coulomb_k=332.0)
+    particles.pair_table = None
+    gather_forces = compute_forces(particles, k=8, coulomb_k=332.0)
+    
+    assert particles.species_id.shape == (40,)
+    assert torch.allclose(table_forces, gather_forces, rtol=1e-4, atol=1e-4 * gather_forces.abs().max().item())
+
+def test_species_encoding_from_elements(simple_particles):
+    assert simple_particles.symbols == ['C']
+    assert simple_particles.species_id.dtype == torch.long
+    assert simple_particles.composition() == {'C': 10}
+    assert list(simple_particles.elements) == ['C'] * 10
+
+def test_composition_cached_until_particles_change():
+    config = load_config()
+    config['particles']['count'] = {'H': 5, 'He': 3}
+    particles = create_particles(config, 'cpu')
+    
+    assert particles.composition() == {'H': 5, 'He': 3}
+    assert particles.elements[5] == 'He'
+    
+    particles.species_id = particles.species_id[:6]
+    assert particles.composition() == {'H': 5, 'He': 1}
+    assert len(particles.elements) == 6
+
+def test_float64_kernel_matches_float32(simple_particles):
+    simple_particles.charges = torch.randn(simple_particles.n_particles)
+    eager = compute_forces(simple_particles, k=4, coulomb_k=332.0)
+    accurate = compute_forces(simple_particles, k=4, coulomb_k=332.0, kernel=make_force_kernel(precision='float64'))
+    assert accurate.dtype == torch.float32
+    assert torch.allclose(accurate, eager, rtol=1e-4, atol=1e-4 * eager.abs().max().item())
+
+@pytest.mark.parametrize("pairwise", [False, True])
+def test_compiled_kernel_matches_eager(simple_particles, pairwise):
+    simple_particles.charges = torch.randn(simple_particles.n_particles)
+    eager = compute_forces(simple_particles, k=4, coulomb_k=332.0, pairwise=pairwise)
+    try:
+        compiled = compute_forces(simple_particles, k=4, coulomb_k=332.0, pairwise=pairwise,
+                                  kernel=make_force_kernel('compiled'))
+    except Exception as e:
+        pytest.skip(f"torch.compile unavailable: {e}")
+    assert torch.allclose(compiled, eager, rtol=1e-4, atol=1e-4 * eager.abs().max().item())
+
 def test_energy_conservation():
     device = 'cpu'
     particles = ParticleSystem(
@@ -0,0 +1,138 @@
+import subprocess
+import sys
+import pytest
+import torch
+from src.utils import load_config, create_particles
+from src.simulator import Simulator
+from src.particle import ParticleSystem
+
+@pytest.fixture
+def headless_config():
+    config = load_config()
+    config['simulation']['device'] = 'cpu'
+    config['simulation']['steps'] = 20
+    config['simulation']['headless'] = True
+    config['simulation']['report_every'] = 10
+    config['renderer']['enabled'] = False
+    return config
+
+def test_headless_run(headless_config, capsys):
+    particles = create_particles(headless_config, 'cpu')
+    simulator = Simulator(particles, headless_config)
+    simulator.run()
+    
+    assert simulator.step == 20
+    assert simulator.steps_per_sec > 0
+    assert simulator.ns_per_day > 0
+    assert "ns/day" in capsys.readouterr().out
+
+def test_headless_does_not_import_gl():
+    code = "import sys, src.simulator, src.utils; sys.exit(int('glfw' in sys.modules or 'OpenGL' in sys.modules))"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+def test_batched_forces_match_single_replicas():
+    from src.physics import compute_forces
+    from src.utils import create_replicas
+    config = load_config()
+    config['particles']['count'] = {'H': 8, 'He': 4}
+    particles = create_replicas(config, 'cpu', seeds=[0, 1, 2])
+    
+    assert particles.positions.shape == (3, 12, 3)
+    for pairwise in [False, True]:
+        batched = compute_forces(particles, 6, 332.0, pairwise=pairwise)
+        for b in range(3):
+            single = compute_forces(particles.replica(b), 6, 332.0, pairwise=pairwise)
+            assert torch.allclose(batched[b], single, rtol=1e-4, atol=1e-4 * single.abs().max().item())
+
+def test_batched_replicas_run(headless_config):
+    from src.utils import create_replicas
+    headless_config['particles']['count'] = {'H': 8, 'He': 4}
+    headless_config['simulation']['integrator'] = 'Verlet'
+    headless_config['replicas'] = {'count': 2, 'seeds': [0, 1], 'temperatures': [300.0, 600.0]}
+    particles = create_replicas(headless_config, 'cpu', [0, 1], [300.0, 600.0])
+    
+    simulator = Simulator(particles, headless_config)
+    simulator.run()
+    
+    observables = simulator.observables()
+    assert simulator.step == 20
+    assert len(observables['temperature']) == 2
+    assert simulator.particles.positions.shape == (2, 12, 3)
+
+def test_multi_step_engine_matches_single_steps(headless_config):
+    headless_config['simulation']['integrator'] = 'Verlet'
+    headless_config['simulation']['report_every'] = 0
+    results = []
+    for steps_per_call in [1, 5]:
+        headless_config['simulation']['steps_per_call'] = steps_per_call
+        torch.manual_seed(0)
+        particles = create_particles(headless_config, 'cpu')
+        simulator = Simulator(particles, headless_config)
+        simulator.run()
+        
+        assert simulator.step == 20
+        assert simulator.engine.graph is None
+        results.append(particles.positions.clone())
+    
+    assert torch.allclose(results[0], results[1])
+
+def test_skin_list_catches_atoms_that_outrun_the_lookahead(headless_config):
+    # A squeezed pair starts at rest, so extrapolating its velocity alone predicts no motion over the call
+    def squeezed_lattice():
+        lattice = torch.tensor([[i, j, l] for i in range(3) for j in range(3) for l in range(3)], dtype=torch.float32)
+        positions = lattice * 3.8 + 20.0
+        positions[1] = positions[0] + torch.tensor([0.0, 0.0, 2.0])
+        n = len(positions)
+        return ParticleSystem(positions=positions, velocities=torch.zeros(n, 3), masses=torch.ones(n) * 12.0,
+                              charges=torch.zeros(n), radii=torch.ones(n) * 1.7, colors=torch.ones(n, 3) * 0.5,
+                              epsilons=torch.ones(n) * 0.105, sigmas=torch.ones(n) * 3.4, elements=['C'] * n,
+                              device='cpu')
+    
+    headless_config['simulation'].update({'integrator': 'Verlet', 'steps': 10, 'report_every': 0})
+    headless_config['physics'].update({'k_neighbors': 2, 'thermostat': 'none'})
+    results = []
+    for skin, steps_per_call in [(0.0, 1), (0.2, 10)]:
+        headless_config['physics']['neighbor_skin'] = skin
+        headless_config['simulation']['steps_per_call'] = steps_per_call
+        simulator = Simulator(squeezed_lattice(), headless_config)
+        simulator.run()
+        results.append(simulator.particles.positions)
+    
+    assert simulator.neighbor_list.builds > 1
+    assert torch.allclose(results[0], results[1], atol=1e-4)
+
+def test_phase_timer_charges_nested_time_once():
+    from src.profiling import PhaseTimer
+    timer = PhaseTimer()
+    with timer.phase('integration'):
+        with timer.phase('forces'):
+            sum(range(10000))
+    timer.steps = 1
+    
+    stats = timer.stats()['phases']
+    assert stats['forces']['calls'] == 1
+    assert stats['integration']['total_s'] >= 0
+    assert abs(sum(p['fraction'] for p in stats.values()) - 1.0) < 1e-9
+
+def test_profiling_reports_phases(headless_config, capsys):
+    headless_config['profiling'] = {'enabled': True, 'summary_every': 10}
+    particles = create_particles(headless_config, 'cpu')
+    simulator = Simulator(particles, headless_config)
+    simulator.run()
+    
+    phases = simulator.stats()['profile']['phases']
+    assert simulator.stats()['profile']['steps'] == 20
+    for name in ['neighbor_search', 'forces', 'integration', 'boundary']:
+        assert phases[name]['calls'] > 0
+    assert "neighbor_search" in capsys.readouterr().out
+
+def test_respa_requires_pme(headless_config):
+    headless_config['simulation']['integrator'] = 'RESPA'
+    particles = create_particles(headless_config, 'cpu')
+    with pytest.raises(ValueError, match="pme"):
+        Simulator(particles, headless_config)
+    
+    headless_config['physics']['electrostatics'] = 'pme'
+    simulator = Simulator(particles, headless_config)
+    simulator.run()
+    assert simulator.step == 20
@@ -0,0 +1,36 @@
+import json
+from src.sweep import completed_ids, expand_grid, variant_config, variant_id, run_sweep
+from src.utils import load_config
+
+def sweep_config():
+    config = load_config()
+    config['simulation'].update({'device': 'cpu', 'steps': 5})
+    config['particles']['count'] = {'H': 10, 'He': 6}
+    return config
+
+def test_expand_grid_and_overrides():
+    variants = expand_grid({'physics.temperature': [200, 300], 'particles.count': [{'H': 4}, {'He': 2}]})
+    assert len(variants) == 4
+    assert variants[1] == {'physics.temperature': 200, 'particles.count': {'He': 2}}
+    
+    config = variant_config(sweep_config(), variants[1], variant_id(variants[1]))
+    assert config['physics']['temperature'] == 200
+    assert config['particles']['count'] == {'He': 2}
+    assert config['simulation']['headless'] and not config['renderer']['enabled']
+    assert variant_id(variants[1]) == variant_id(dict(reversed(list(variants[1].items()))))
+
+def test_sweep_streams_results_and_resumes(tmp_path):
+    results_path = str(tmp_path / "sweep.jsonl")
+    grid = {'physics.temperature': [100, 300], 'simulation.dt': [0.05]}
+    
+    first = run_sweep(sweep_config(), grid, results_path, workers=2, threads=1)
+    assert sorted(record['overrides']['physics.temperature'] for record in first) == [100, 300]
+    assert all(record['status'] == 'ok' and record['threads'] == 1 for record in first)
+    assert len(completed_ids(results_path)) == 2
+    
+    grid['physics.temperature'].append(500)
+    second = run_sweep(sweep_config(), grid, results_path, workers=2, threads=1)
+    assert [record['overrides']['physics.temperature'] for record in second] == [500]
+    
+    lines = [json.loads(line) for line in open(results_path)]
+    assert len(lines) == 3
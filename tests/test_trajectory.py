@@ -0,0 +1,66 @@
+import pytest
+import torch
+from src.utils import load_config, create_particles
+
+h5py = pytest.importorskip("h5py")
+
+from src.simulator import Simulator
+from src.trajectory import TrajectoryWriter
+
+def test_trajectory_roundtrip(tmp_path):
+    config = load_config()
+    config['particles']['count'] = {'H': 6, 'He': 4}
+    particles = create_particles(config, 'cpu')
+    path = tmp_path / "traj.h5"
+    
+    writer = TrajectoryWriter({'path': str(path), 'every': 1, 'queue_size': 4}, particles, 0.1)
+    for step in range(3):
+        particles.positions += 1.0
+        writer.write(step, particles)
+    writer.close()
+    
+    with h5py.File(path, 'r') as f:
+        assert f['positions'].shape == (3, 10, 3)
+        assert f['velocities'].shape == (3, 10, 3)
+        assert list(f['step'][:]) == [0, 1, 2]
+        assert torch.allclose(torch.from_numpy(f['positions'][2]), particles.positions)
+        assert [s.decode() for s in f['species/symbol'][:]] == ['H', 'He']
+        assert list(f['species/count'][:]) == [6, 4]
+    
+    assert writer.stats()['frames_written'] + writer.stats()['dropped'] == 3
+
+def test_trajectory_float16(tmp_path):
+    config = load_config()
+    config['particles']['count'] = {'Ne': 5}
+    particles = create_particles(config, 'cpu')
+    
+    writer = TrajectoryWriter({'path': str(tmp_path / "traj.h5"), 'float16': True, 'velocities': False},
+                              particles, 0.1)
+    writer.write(0, particles)
+    writer.close()
+    
+    with h5py.File(tmp_path / "traj.h5", 'r') as f:
+        assert f['positions'].dtype == 'f2'
+        assert 'velocities' not in f
+
+def test_resume_keeps_frames_before_checkpoint(tmp_path):
+    config = load_config()
+    config['particles']['count'] = {'H': 6, 'He': 4}
+    config['simulation'].update({'device': 'cpu', 'steps': 6, 'headless': True, 'report_every': 0})
+    config['renderer']['enabled'] = False
+    config['output']['trajectory'] = {'enabled': True, 'path': str(tmp_path / "traj.h5"), 'every': 2}
+    
+    first = Simulator(create_particles(config, 'cpu'), config)
+    first.run()
+    with h5py.File(tmp_path / "traj.h5", 'r') as f:
+        early = f['positions'][:2].copy()
+    
+    config['simulation']['steps'] = 8
+    resumed = Simulator(first.particles, config)
+    resumed.step = 4
+    resumed.run()
+    
+    with h5py.File(tmp_path / "traj.h5", 'r') as f:
+        assert list(f['step'][:]) == [2, 4, 6, 8]
+        assert (f['positions'][:2] == early).all()
+        assert [s.decode() for s in f['species/symbol'][:]] == ['H', 'He']
@@ -0,0 +1,72 @@
+import pytest
+import torch
+from src.utils import load_config, create_particles, lattice_positions, make_renderer, poisson_disk_positions
+
+def min_separation(positions, box_size=None):
+    diff = positions.unsqueeze(1) - positions.unsqueeze(0)
+    if box_size is not None:
+        box = torch.tensor(box_size)
+        diff = diff - box * torch.round(diff / box)
+    distances = torch.linalg.norm(diff, dim=-1)
+    distances.fill_diagonal_(float('inf'))
+    return distances.min().item()
+
+@pytest.mark.parametrize("periodic", [False, True])
+def test_poisson_disk_is_overlap_free(periodic):
+    box_size = [30.0, 20.0, 25.0]
+    positions = poisson_disk_positions(500, box_size, 2.5, periodic)
+    
+    assert positions.shape == (500, 3)
+    assert (positions >= 0).all() and (positions <= torch.tensor(box_size)).all()
+    assert min_separation(positions, box_size if periodic else None) >= 2.5
+
+def test_poisson_disk_reports_overfull_box():
+    with pytest.raises(ValueError):
+        poisson_disk_positions(1000, [10.0, 10.0, 10.0], 3.0)
+
+def test_fcc_lattice_fills_box_without_overlap():
+    box_size = [40.0, 40.0, 40.0]
+    positions = lattice_positions(1000, box_size)
+    
+    assert positions.shape == (1000, 3)
+    assert (positions > 0).all() and (positions < 40.0).all()
+    assert min_separation(positions) > 2.5
+
+@pytest.mark.parametrize("state", ["poisson", "fcc", "lattice", "random"])
+def test_create_particles_respects_boundary(state):
+    config = load_config()
+    config['particles']['initial_state'] = state
+    config['particles']['count'] = {'H': 60, 'He': 40}
+    config['boundary']['size'] = [30.0, 30.0, 30.0]
+    particles = create_particles(config, 'cpu')
+    
+    assert particles.positions.shape == (100, 3)
+    assert (particles.positions >= 0).all() and (particles.positions <= 30.0).all()
+    assert particles.composition() == {'H': 60, 'He': 40}
+    assert particles.masses[0] != particles.masses[-1]
+    assert particles.colors.shape == (100, 3)
+    if state != "random":
+        assert min_separation(particles.positions) > 2.0
+
+def test_element_table_cache_follows_yaml(tmp_path):
+    from src.utils import load_element_table, load_elements
+    path = tmp_path / "elements.yaml"
+    path.write_text("elements:\n  X: {mass: 2.0, radius: 1.0, color: [1, 0, 0], lj_epsilon: 0.1, lj_sigma: 3.0}\n")
+    
+    table = load_element_table(str(path))
+    assert (tmp_path / "elements.npz").exists()
+    assert table['mass'][table['index']['X']] == 2.0
+    assert load_elements(str(path))['X']['charge'] == 0.0
+    
+    path.write_text("elements:\n  X: {mass: 5.0, radius: 1.0, color: [1, 0, 0], lj_epsilon: 0.1, lj_sigma: 3.0}\n")
+    table = load_element_table(str(path))
+    assert table['mass'][table['index']['X']] == 5.0
+
+def test_make_renderer_skips_headless_and_disabled():
+    config = load_config()
+    config['simulation']['headless'] = True
+    assert make_renderer(config) is None
+    
+    config['simulation']['headless'] = False
+    config['renderer']['enabled'] = False
+    assert make_renderer(config) is None